@@ -20,7 +20,10 @@ st.set_page_config(
 
 from docx import Document
 from docx.shared import Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_BREAK
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from docx.opc.oxml import serialize_part_xml
 import re
 import tempfile
 import os
@@ -29,6 +32,15 @@ from io import BytesIO
 import uuid
 import time
 import atexit
+import hashlib
+import json
+import codecs
+import struct
+import zlib
+import threading
+import tracemalloc
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 
 # =============================================================================
 # CONSTANTS & CONFIGURATION
@@ -37,6 +49,26 @@ import atexit
 TEMP_DIR = tempfile.gettempdir()
 MAX_FILES = 5
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+RESULTS_PAGE_SIZE = 50  # Số dòng mỗi trang trong bảng kết quả
+
+# Giới hạn bộ nhớ cho mỗi batch
+# Đo bộ nhớ từng giai đoạn bằng tracemalloc: làm chậm toàn bộ tiến trình khoảng
+# 2-3 lần nên chỉ bật khi cần chẩn đoán (biến môi trường GXN_MEMORY_TRACKING=1)
+MEMORY_TRACKING = os.environ.get('GXN_MEMORY_TRACKING') == '1'
+MEMORY_BUDGET = int(os.environ.get('GXN_MEMORY_BUDGET_MB', '512')) * 1024 * 1024  # Đổi bằng GXN_MEMORY_BUDGET_MB
+PARSE_MEMORY_FACTOR = 5  # Bộ nhớ khi parse so với tổng kích thước các part XML đã giải nén
+OUTPUT_MEMORY_FACTOR = 3  # Mỗi file output nằm trong ZIP, nút tải từng file và bản in gộp
+MEMORY_STAGES = ['upload', 'parse', 'extract', 'fill', 'zip', 'merge']
+
+# Giới hạn số tác vụ nặng (trích xuất, điền, gộp) chạy đồng thời trên toàn server.
+# Code Python chạy tuần tự do GIL nên tăng số này ít cải thiện thông lượng.
+ADMISSION_MAX_CONCURRENT = 2
+ADMISSION_POLL_SECONDS = 0.5  # Chu kỳ cập nhật vị trí hàng đợi trên giao diện
+
+# Nhật ký checkpoint cho phép chạy tiếp batch sau khi server khởi động lại
+# (GXN_JOURNAL_DIR để đổi thư mục, ví dụ load test dùng thư mục tạm riêng)
+JOURNAL_DIR = os.environ.get('GXN_JOURNAL_DIR') or os.path.join(TEMP_DIR, 'giay_xac_nhan_journal')
+JOURNAL_RETENTION_SECONDS = 24 * 60 * 60  # 24 giờ
 
 # Session management
 SESSION_ID = str(uuid.uuid4())[:8]
@@ -62,6 +94,43 @@ def get_unique_temp_path(prefix, extension=".docx"):
     SESSION_FILES.append(path)
     return path
 
+# Cụm từ nhận diện giấy xác nhận tình trạng hôn nhân
+CERTIFICATE_MARKER = r'GIẤY XÁC NHẬN TÌNH TRẠNG HÔN NHÂN'
+
+# Lọc nhanh trước khi parse: chỉ đọc tối đa phần đầu của word/document.xml
+PREFILTER_MAX_BYTES = 1024 * 1024  # 1MB XML đã giải nén
+PREFILTER_CHUNK_SIZE = 64 * 1024
+
+# Danh sách template theo loại giấy tờ (loại cụ thể đặt trước, mặc định đặt cuối)
+DEFAULT_DOC_TYPE = 'GXN_HON_NHAN'
+TEMPLATE_REGISTRY = [
+    {
+        'doc_type': DEFAULT_DOC_TYPE,
+        'name': 'Giấy xác nhận tình trạng hôn nhân (mẫu chuẩn)',
+        'path': os.path.join('temp', 'mau.docx'),
+        'marker': CERTIFICATE_MARKER
+    }
+]
+TEMPLATE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 64MB
+# Cache output dùng chung mọi session, GXN_OUTPUT_CACHE_MB=0 để tắt (load test)
+OUTPUT_CACHE_MAX_BYTES = int(os.environ.get('GXN_OUTPUT_CACHE_MB', '64')) * 1024 * 1024
+
+# Nhãn trong template cần điền dữ liệu
+FIELD_MAPPINGS = [
+    ('Ngày, tháng, năm sinh:', 'Ngày sinh'),
+    ('Nơi cưu trú:', 'Nơi cư trú'),
+    ('Giấy tờ tùy thân:', 'Giấy tờ tùy thân'),
+    ('Tình trạng hôn nhân:', 'Tình trạng hôn nhân'),
+    ('Mục đích sử dụng:', 'Mục đích sử dụng')
+]
+FILL_LABELS = [
+    'Số:', 'Ngày, tháng, năm cấp:', 'Họ, chữ đệm, tên:', 'Họ, chữ đệm, tên, chức vụ người ký',
+    'Giới tính:', 'Dân tộc:', 'Quốc tịch:'
+] + [field_name for field_name, _ in FIELD_MAPPINGS]
+
+# Các khóa nội bộ không hiển thị cho người dùng
+INTERNAL_KEYS = ['file_name', 'file_index', 'doc_type', 'content_hash']
+
 # Danh sách từ khóa cần loại bỏ khi tìm tên người ký
 BLACKLIST_KEYWORDS = [
     'CHỦ TỊCH', 'PHÓ CHỦ TỊCH', 'KT.', 'GIẤY', 'XÁC NHẬN', 'TÌNH TRẠNG', 
@@ -191,6 +260,279 @@ def validate_file(file_path):
     except Exception as e:
         return False, f"File không hợp lệ: {str(e)}"
 
+def quick_check_certificate(file_path):
+    """
+    Lọc nhanh file không phải giấy xác nhận trước khi parse toàn bộ
+    
+    Chỉ giải nén dần word/document.xml, bỏ thẻ XML và tìm cụm từ nhận diện
+    trong tối đa PREFILTER_MAX_BYTES đầu tiên. Trường hợp không quyết định
+    được (file không tồn tại, quá lớn, thiếu document.xml...) thì cho qua để
+    validate_file và bước parse đầy đủ xử lý như cũ.
+    
+    Args:
+        file_path (str): Đường dẫn file
+    
+    Returns:
+        tuple: (is_candidate, error_message)
+    """
+    if not os.path.isfile(file_path):
+        return True, None
+    
+    file_size = os.path.getsize(file_path)
+    if file_size == 0 or file_size > MAX_FILE_SIZE:
+        return True, None
+    
+    try:
+        with zipfile.ZipFile(file_path) as package:
+            try:
+                stream = package.open('word/document.xml')
+            except KeyError:
+                return True, None
+            
+            with stream:
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+                markup_tail = ''
+                text_tail = ''
+                read_bytes = 0
+                
+                while read_bytes < PREFILTER_MAX_BYTES:
+                    chunk = stream.read(PREFILTER_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    read_bytes += len(chunk)
+                    
+                    # Giữ lại thẻ XML bị cắt ngang cho lần đọc sau
+                    markup = markup_tail + decoder.decode(chunk)
+                    cut = markup.rfind('<')
+                    if cut > markup.rfind('>'):
+                        markup, markup_tail = markup[:cut], markup[cut:]
+                    else:
+                        markup_tail = ''
+                    
+                    # Giữ lại đuôi văn bản để tìm cụm từ nằm vắt qua hai lần đọc
+                    text = text_tail + re.sub(r'<[^>]*>', '', markup)
+                    if re.search(CERTIFICATE_MARKER, text, re.IGNORECASE):
+                        return True, None
+                    text_tail = text[-len(CERTIFICATE_MARKER):]
+        
+        return False, "File không phải Giấy xác nhận tình trạng hôn nhân"
+    
+    except zipfile.BadZipFile as e:
+        return False, f"File không hợp lệ: {str(e)}"
+    except Exception:
+        return True, None
+
+# =============================================================================
+# MEMORY FUNCTIONS
+# =============================================================================
+
+@contextmanager
+def memory_stage(memory_stats, stage):
+    """
+    Ước lượng bộ nhớ đỉnh của một giai đoạn xử lý
+    
+    Không reset đỉnh của tracemalloc vì trạng thái này dùng chung cho toàn
+    tiến trình (session khác, load_test cũng đọc). Nếu giai đoạn đẩy đỉnh
+    của tiến trình lên thì lấy phần tăng so với lúc bắt đầu, nếu không thì
+    chỉ biết phần bộ nhớ còn giữ lại sau giai đoạn. Khi nhiều session chạy
+    cùng lúc, số liệu chỉ mang tính ước lượng.
+    
+    Args:
+        memory_stats (dict): Nơi ghi kết quả (stage -> bytes), None để bỏ qua
+        stage (str): Tên giai đoạn
+    """
+    if memory_stats is None or not tracemalloc.is_tracing():
+        yield
+        return
+    
+    start_current, start_peak = tracemalloc.get_traced_memory()
+    try:
+        yield
+    finally:
+        end_current, end_peak = tracemalloc.get_traced_memory()
+        if end_peak > start_peak:
+            stage_peak = end_peak - start_current
+        else:
+            stage_peak = max(0, end_current - start_current)
+        memory_stats[stage] = max(memory_stats.get(stage, 0), stage_peak)
+        memory_stats['batch'] = max(memory_stats.get('batch', 0), stage_peak)
+
+def get_xml_size(file_obj):
+    """
+    Tổng kích thước đã giải nén của các part XML trong file .docx
+    
+    Chỉ đọc central directory của ZIP, không giải nén. Ảnh và media khác
+    không được parse nên không tính.
+    
+    Args:
+        file_obj: Đường dẫn hoặc file object của file .docx
+    
+    Returns:
+        int: Số bytes, None nếu không đọc được file ZIP
+    """
+    try:
+        with zipfile.ZipFile(file_obj) as package:
+            return sum(
+                info.file_size for info in package.infolist()
+                if info.filename.endswith(('.xml', '.rels'))
+            )
+    except Exception:
+        return None
+
+def plan_memory_budget(file_sizes, xml_sizes, template_size):
+    """
+    Chia file upload thành các lượt xử lý vừa giới hạn bộ nhớ
+    
+    Ước lượng trước khi parse: file upload nằm trong bộ nhớ suốt lượt, mỗi
+    lần parse cần khoảng PARSE_MEMORY_FACTOR lần tổng kích thước các part
+    XML đã giải nén, mỗi file output được giữ OUTPUT_MEMORY_FACTOR bản.
+    
+    Args:
+        file_sizes (list): Kích thước từng file upload (bytes)
+        xml_sizes (list): Kích thước XML đã giải nén (get_xml_size), None nếu không đọc được
+        template_size (int): Kích thước file template (bytes)
+    
+    Returns:
+        tuple: (chunks, rejected) - danh sách các lượt (mỗi lượt là danh sách
+            chỉ số file) và danh sách chỉ số file vượt giới hạn kể cả khi xử lý riêng
+    """
+    chunks, rejected = [], []
+    chunk = []
+    upload_total = 0
+    parse_peak = 0
+    output_cost = template_size * OUTPUT_MEMORY_FACTOR
+    
+    for i, (file_size, xml_size) in enumerate(zip(file_sizes, xml_sizes)):
+        # Không đọc được ZIP: coi như toàn bộ file là XML
+        file_parse = (file_size if xml_size is None else xml_size) * PARSE_MEMORY_FACTOR
+        if file_size + file_parse + output_cost > MEMORY_BUDGET:
+            rejected.append(i)
+            continue
+        
+        estimate = (upload_total + file_size) + max(parse_peak, file_parse) + (len(chunk) + 1) * output_cost
+        if chunk and estimate > MEMORY_BUDGET:
+            # Lượt hiện tại đã đầy: chuyển file sang lượt sau
+            chunks.append(chunk)
+            chunk, upload_total, parse_peak = [], 0, 0
+        
+        chunk.append(i)
+        upload_total += file_size
+        parse_peak = max(parse_peak, file_parse)
+    
+    if chunk:
+        chunks.append(chunk)
+    
+    return chunks, rejected
+
+# =============================================================================
+# DUPLICATE DETECTION FUNCTIONS
+# =============================================================================
+
+def compute_content_hash(file_bytes):
+    """
+    Tính hash nội dung file để nhận diện bản trùng hoàn toàn
+    
+    Args:
+        file_bytes (bytes): Nội dung file
+    
+    Returns:
+        str: Chuỗi hash SHA-256
+    """
+    return hashlib.sha256(file_bytes).hexdigest()
+
+def normalize_key_fields(data):
+    """
+    Chuẩn hóa các trường khóa (Số, Họ tên) để phát hiện bản trùng gần đúng
+    
+    Args:
+        data (dict): Dữ liệu đã trích xuất
+    
+    Returns:
+        tuple: (so, ho_ten) đã chuẩn hóa, hoặc None nếu thiếu trường
+    """
+    if not data:
+        return None
+    
+    so = re.sub(r'\s+', '', data.get('Số', '')).upper()
+    ho_ten = ' '.join(data.get('Họ tên', '').split()).upper()
+    
+    if not so or not ho_ten:
+        return None
+    
+    return so, ho_ten
+
+def create_duplicate_index():
+    """
+    Tạo chỉ mục phát hiện trùng lặp cho một lượt upload
+    
+    Returns:
+        dict: Chỉ mục theo hash nội dung và theo trường khóa
+    """
+    return {
+        'by_hash': {},  # content_hash -> (file_name, data, error)
+        'by_key': {}    # (so, ho_ten) -> file_name
+    }
+
+def find_exact_duplicate(duplicate_index, content_hash):
+    """
+    Tìm kết quả trích xuất của file có cùng nội dung đã upload trước đó
+    
+    Args:
+        duplicate_index (dict): Chỉ mục trùng lặp
+        content_hash (str): Hash nội dung file
+    
+    Returns:
+        tuple: (file_name, data, error) của file gốc, hoặc None
+    """
+    return duplicate_index['by_hash'].get(content_hash)
+
+def register_upload(duplicate_index, content_hash, file_name):
+    """
+    Ghi nhận hash của file upload trước khi trích xuất
+    
+    Kết quả trích xuất được bổ sung sau bằng register_extraction.
+    
+    Args:
+        duplicate_index (dict): Chỉ mục trùng lặp
+        content_hash (str): Hash nội dung file
+        file_name (str): Tên file
+    
+    Returns:
+        str: Tên file gốc có cùng nội dung (trùng hoàn toàn), hoặc None
+    """
+    original = find_exact_duplicate(duplicate_index, content_hash)
+    if original:
+        return original[0]
+    
+    duplicate_index['by_hash'][content_hash] = (file_name, None, None)
+    return None
+
+def register_extraction(duplicate_index, content_hash, file_name, data, error):
+    """
+    Ghi nhận kết quả trích xuất vào chỉ mục
+    
+    Args:
+        duplicate_index (dict): Chỉ mục trùng lặp
+        content_hash (str): Hash nội dung file
+        file_name (str): Tên file
+        data (dict): Dữ liệu đã trích xuất
+        error (str): Thông báo lỗi (nếu có)
+    
+    Returns:
+        str: Tên file gốc có cùng Số và Họ tên (trùng gần đúng), hoặc None
+    """
+    duplicate_index['by_hash'][content_hash] = (file_name, data, error)
+    
+    key = normalize_key_fields(data)
+    if key is None:
+        return None
+    
+    if key in duplicate_index['by_key']:
+        return duplicate_index['by_key'][key]
+    
+    duplicate_index['by_key'][key] = file_name
+    return None
+
 # =============================================================================
 # DATA EXTRACTION FUNCTIONS
 # =============================================================================
@@ -326,32 +668,58 @@ def sanitize_filename(filename):
     filename = re.sub(r'\s+', '_', filename)
     return filename
 
-def extract_data_from_input(input_path):
+def extract_data_from_input(input_path, memory_stats=None):
     """
     Trích xuất dữ liệu từ file input
     
     Args:
         input_path (str): Đường dẫn file input
+        memory_stats (dict): Nơi ghi bộ nhớ đỉnh từng giai đoạn (tùy chọn)
         
     Returns:
         tuple: (data_dict, error_message)
     """
     try:
-        # Validate file
-        is_valid, error = validate_file(input_path)
-        if not is_valid:
-            return None, error
+        with memory_stage(memory_stats, 'parse'):
+            # Lọc nhanh file không phải giấy xác nhận trước khi parse
+            is_candidate, error = quick_check_certificate(input_path)
+            if not is_candidate:
+                return None, error
+            
+            # Validate file
+            is_valid, error = validate_file(input_path)
+            if not is_valid:
+                return None, error
+            
+            # Extract text
+            all_text = extract_text_from_document(input_path)
         
-        # Extract text
-        all_text = extract_text_from_document(input_path)
+        with memory_stage(memory_stats, 'extract'):
+            return extract_data_from_text(all_text)
+    
+    except Exception as e:
+        return None, f"Lỗi không xác định: {str(e)}"
+
+def extract_data_from_text(all_text):
+    """
+    Trích xuất dữ liệu từ nội dung văn bản đã đọc
+    
+    Args:
+        all_text (str): Nội dung văn bản
         
+    Returns:
+        tuple: (data_dict, error_message)
+    """
+    try:
         if not all_text.strip():
             return None, "File không có nội dung"
         
         # Kiểm tra loại file
-        if not re.search(r'GIẤY XÁC NHẬN TÌNH TRẠNG HÔN NHÂN', all_text, re.IGNORECASE):
+        if not re.search(CERTIFICATE_MARKER, all_text, re.IGNORECASE):
             return None, "File không phải Giấy xác nhận tình trạng hôn nhân"
         
+        doc_type = detect_document_type(all_text)
+        
         # Define field patterns
         field_patterns = {
             'Số': [r'Số:\s*([\w/\-]+)', r'Số\s*:\s*([\w/\-]+)'],
@@ -389,6 +757,7 @@ def extract_data_from_input(input_path):
         
         # Set người đề nghị
         data['Người đề nghị'] = data['Họ tên']
+        data['doc_type'] = doc_type
         
         # Clean data
         for key in data:
@@ -411,118 +780,811 @@ def extract_data_from_input(input_path):
     except Exception as e:
         return None, f"Lỗi không xác định: {str(e)}"
 # =============================================================================
-# TEMPLATE FILLING FUNCTIONS
+# PACKAGE WRITER FUNCTIONS
 # =============================================================================
 
-def fill_template(template_path, data, output_docx_path):
+def read_raw_zip_entries(package_bytes):
     """
-    Điền dữ liệu vào template
+    Đọc các entry của file .docx ở dạng đã nén, không giải nén
+    
+    Args:
+        package_bytes (bytes): Nội dung file .docx
+    
+    Returns:
+        list: Danh sách entry (tên, thông tin header và dữ liệu nén gốc)
+    """
+    entries = []
+    with zipfile.ZipFile(BytesIO(package_bytes)) as package:
+        for info in package.infolist():
+            # Local header: 30 byte cố định, độ dài tên và extra ở byte 26-29
+            name_length, extra_length = struct.unpack(
+                '<HH', package_bytes[info.header_offset + 26:info.header_offset + 30]
+            )
+            data_start = info.header_offset + 30 + name_length + extra_length
+            
+            entries.append({
+                'name': info.filename,
+                'flag_bits': info.flag_bits & ~0x08,  # Ghi kích thước ngay trong local header
+                'compress_type': info.compress_type,
+                'date_time': info.date_time,
+                'crc': info.CRC,
+                'compress_size': info.compress_size,
+                'file_size': info.file_size,
+                'external_attr': info.external_attr,
+                'data': package_bytes[data_start:data_start + info.compress_size]
+            })
+    return entries
+
+def deflate_entry(entry, content):
+    """
+    Tạo entry mới với nội dung đã thay đổi, nén deflate
+    
+    Args:
+        entry (dict): Entry gốc (giữ tên, thời gian, thuộc tính)
+        content (bytes): Nội dung mới chưa nén
+    
+    Returns:
+        dict: Entry mới
+    """
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    data = compressor.compress(content) + compressor.flush()
+    
+    new_entry = dict(entry)
+    new_entry.update({
+        'compress_type': zipfile.ZIP_DEFLATED,
+        'crc': zlib.crc32(content) & 0xFFFFFFFF,
+        'compress_size': len(data),
+        'file_size': len(content),
+        'data': data
+    })
+    return new_entry
+
+def write_package(raw_entries, replacements, output):
+    """
+    Ghi file .docx: chép nguyên dữ liệu nén của các part không đổi, chỉ nén
+    lại các part được thay thế
+    
+    Args:
+        raw_entries (list): Entry gốc từ read_raw_zip_entries
+        replacements (dict): Tên part -> nội dung mới (bytes)
+        output: File object đã mở ở chế độ ghi nhị phân
+    """
+    central_directory = []
+    offset = 0
+    
+    for entry in raw_entries:
+        if entry['name'] in replacements:
+            entry = deflate_entry(entry, replacements[entry['name']])
+        
+        name = entry['name'].encode('utf-8')
+        year, month, day, hour, minute, second = entry['date_time']
+        dos_time = (hour << 11) | (minute << 5) | (second // 2)
+        dos_date = ((year - 1980) << 9) | (month << 5) | day
+        
+        local_header = struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, 20, entry['flag_bits'], entry['compress_type'],
+            dos_time, dos_date, entry['crc'], entry['compress_size'], entry['file_size'],
+            len(name), 0
+        ) + name
+        output.write(local_header)
+        output.write(entry['data'])
+        
+        central_directory.append(struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, 20, 20, entry['flag_bits'], entry['compress_type'],
+            dos_time, dos_date, entry['crc'], entry['compress_size'], entry['file_size'],
+            len(name), 0, 0, 0, 0, entry['external_attr'], offset
+        ) + name)
+        offset += len(local_header) + len(entry['data'])
+    
+    central_directory = b''.join(central_directory)
+    output.write(central_directory)
+    output.write(struct.pack(
+        '<IHHHHIIH', 0x06054b50, 0, 0, len(raw_entries), len(raw_entries),
+        len(central_directory), offset, 0
+    ))
+
+def save_filled_document(compiled, doc, output):
+    """
+    Lưu văn bản đã điền: chỉ part văn bản chính được ghi lại, các part khác
+    (styles, theme, font, ảnh...) chép nguyên từ template
+    
+    Args:
+        compiled (dict): Template đã biên dịch
+        doc (Document): Văn bản đã điền từ template này
+        output: Đường dẫn file hoặc file object ghi nhị phân
+    """
+    document_xml = serialize_part_xml(doc.part.element)
+    replacements = {compiled['main_part_name']: document_xml}
+    
+    if isinstance(output, str):
+        with open(output, 'wb') as f:
+            write_package(compiled['raw_entries'], replacements, f)
+    else:
+        write_package(compiled['raw_entries'], replacements, output)
+
+# =============================================================================
+# TEMPLATE REGISTRY FUNCTIONS
+# =============================================================================
+
+def create_lru_cache():
+    """
+    Tạo cache LRU giới hạn theo tổng dung lượng
+    
+    Returns:
+        dict: Cache gồm entries, tổng dung lượng và lock
+    """
+    return {
+        'entries': OrderedDict(),  # cache_key -> (value, size)
+        'total_bytes': 0,
+        'lock': threading.Lock()
+    }
+
+def lru_cache_get(cache, cache_key):
+    """
+    Lấy giá trị từ cache LRU và đánh dấu vừa được dùng
+    
+    Returns:
+        Giá trị đã lưu, hoặc None nếu chưa có
+    """
+    with cache['lock']:
+        entry = cache['entries'].get(cache_key)
+        if entry is None:
+            return None
+        cache['entries'].move_to_end(cache_key)
+        return entry[0]
+
+def lru_cache_put(cache, cache_key, value, size, max_bytes):
+    """
+    Lưu giá trị vào cache LRU, loại bỏ mục ít dùng nhất khi vượt giới hạn
+    
+    Args:
+        cache (dict): Cache từ create_lru_cache
+        cache_key: Khóa
+        value: Giá trị cần lưu
+        size (int): Dung lượng ước tính của giá trị (bytes)
+        max_bytes (int): Tổng dung lượng tối đa của cache
+    """
+    # Giá trị lớn hơn giới hạn thì không lưu (max_bytes = 0 để tắt cache)
+    if size > max_bytes:
+        return
+    
+    with cache['lock']:
+        if cache_key in cache['entries']:
+            return
+        cache['entries'][cache_key] = (value, size)
+        cache['total_bytes'] += size
+        
+        while cache['total_bytes'] > max_bytes and len(cache['entries']) > 1:
+            _, (_, evicted_size) = cache['entries'].popitem(last=False)
+            cache['total_bytes'] -= evicted_size
+
+@st.cache_resource
+def get_template_cache():
+    """
+    Lấy bộ nhớ đệm template đã biên dịch (dùng chung giữa các session, giữ qua các lần rerun)
+    
+    Returns:
+        dict: Cache LRU cache_key -> compiled template
+    """
+    return create_lru_cache()
+
+@st.cache_resource
+def get_output_cache():
+    """
+    Lấy bộ nhớ đệm file output đã điền (dùng chung giữa các session)
+    
+    Returns:
+        dict: Cache LRU hash(dữ liệu + template) -> nội dung .docx
+    """
+    return create_lru_cache()
+
+def detect_document_type(all_text):
+    """
+    Xác định loại giấy tờ dựa trên nội dung văn bản
+    
+    Args:
+        all_text (str): Nội dung văn bản
+    
+    Returns:
+        str: Mã loại giấy tờ trong TEMPLATE_REGISTRY
+    """
+    for entry in TEMPLATE_REGISTRY:
+        if re.search(entry['marker'], all_text, re.IGNORECASE):
+            return entry['doc_type']
+    return DEFAULT_DOC_TYPE
+
+def select_template(doc_type):
+    """
+    Chọn template phù hợp với loại giấy tờ
+    
+    Args:
+        doc_type (str): Mã loại giấy tờ
+    
+    Returns:
+        str: Đường dẫn file template
+    """
+    for entry in TEMPLATE_REGISTRY:
+        if entry['doc_type'] == doc_type and os.path.exists(entry['path']):
+            return entry['path']
+    
+    for entry in TEMPLATE_REGISTRY:
+        if entry['doc_type'] == DEFAULT_DOC_TYPE:
+            return entry['path']
+    
+    return None
+
+def compile_template(template_path):
+    """
+    Biên dịch template thành kế hoạch điền dùng lại được
+    
+    Kế hoạch điền gồm nội dung file template và vị trí các ô có nhãn cần
+    điền, để mỗi lần điền không phải đọc file và quét lại toàn bộ bảng.
     
     Args:
         template_path (str): Đường dẫn file template
-        data (dict): Dữ liệu cần điền
-        output_docx_path (str): Đường dẫn file output
         
     Returns:
-        bool: True nếu thành công
+        dict: Template đã biên dịch, hoặc None nếu lỗi
     """
     try:
-        if not os.path.exists(template_path):
-            return False
-            
-        doc = Document(template_path)
+        with open(template_path, 'rb') as f:
+            template_bytes = f.read()
+        
+        doc = Document(BytesIO(template_bytes))
+        
+        # Chỉ lấy mỗi ô gộp một lần và chỉ các ô có nhãn cần điền
+        plan = []
+        for table_index, table in enumerate(doc.tables):
+            seen_cells = set()
+            for cell_index, cell in enumerate(table._cells):
+                if id(cell._tc) in seen_cells:
+                    continue
+                seen_cells.add(id(cell._tc))
+                
+                cell_text = cell.text
+                if any(label in cell_text for label in FILL_LABELS):
+                    plan.append((table_index, cell_index))
+        
+        return {
+            'path': template_path,
+            'bytes': template_bytes,
+            'content_hash': compute_content_hash(template_bytes),
+            'plan': plan,
+            'raw_entries': read_raw_zip_entries(template_bytes),
+            'main_part_name': doc.part.partname.lstrip('/'),
+            # Nội dung template và bản sao các entry nén
+            'size': 2 * len(template_bytes)
+        }
+    except Exception:
+        return None
+
+def get_compiled_template(template_path):
+    """
+    Lấy template đã biên dịch từ cache LRU, biên dịch nếu chưa có
+    
+    Args:
+        template_path (str): Đường dẫn file template
         
-        # Fill data in tables
+    Returns:
+        dict: Template đã biên dịch, hoặc None nếu lỗi
+    """
+    if not template_path or not os.path.exists(template_path):
+        return None
+    
+    stat = os.stat(template_path)
+    cache_key = (os.path.abspath(template_path), stat.st_mtime_ns, stat.st_size)
+    cache = get_template_cache()
+    
+    compiled = lru_cache_get(cache, cache_key)
+    if compiled:
+        return compiled
+    
+    compiled = compile_template(template_path)
+    if not compiled:
+        return None
+    
+    lru_cache_put(cache, cache_key, compiled, compiled['size'], TEMPLATE_CACHE_MAX_BYTES)
+    return compiled
+
+# =============================================================================
+# TEMPLATE FILLING FUNCTIONS
+# =============================================================================
+
+def fill_cell(cell, data):
+    """
+    Điền dữ liệu vào một ô của bảng
+    
+    Args:
+        cell: Ô bảng (python-docx)
+        data (dict): Dữ liệu cần điền
+    """
+    cell_text = cell.text
+    
+    # Replace specific patterns
+    if 'Số:' in cell_text and data.get('Số'):
+        cell.text = re.sub(r'Số:\s*[.………_\-]+', f"Số: {data['Số']}", cell_text, count=1)
+    
+    if 'Ngày, tháng, năm cấp:' in cell_text and data.get('Ngày cấp'):
+        cell.text = re.sub(r'Ngày, tháng, năm cấp:\s*[.………/\-]+', f"Ngày, tháng, năm cấp: {data['Ngày cấp']}", cell_text, count=1)
+    
+    if 'Họ, chữ đệm, tên:' in cell_text and data.get('Họ tên'):
+        cell.text = re.sub(r'Họ, chữ đệm, tên:\s*[.…………]+', f"Họ, chữ đệm, tên: {data['Họ tên']}", cell_text)
+    
+    if 'Họ, chữ đệm, tên, chức vụ người ký' in cell_text and data.get('Người ký'):
+        cell.text = re.sub(r'Họ, chữ đệm, tên, chức vụ người ký[^:]*:\s*[.…………]+', f"Họ, chữ đệm, tên, chức vụ người ký Giấy xác nhận tình trạng hôn nhân: {data['Người ký']}", cell_text, count=1)
+    
+    # Flexible string replacement for different dot formats
+    if 'Giới tính:' in cell_text and data.get('Giới tính'):
+        # Try multiple dot patterns
+        patterns = ['Giới tính: …………….', 'Giới tính:…………….']
+        for pattern in patterns:
+            if pattern in cell_text:
+                cell.text = cell_text.replace(pattern, f"Giới tính: {data['Giới tính']}")
+                break
+    
+    if 'Dân tộc:' in cell.text and data.get('Dân tộc'):
+        patterns = ['Dân tộc: …………….', 'Dân tộc:…………….']
+        for pattern in patterns:
+            if pattern in cell.text:
+                cell.text = cell.text.replace(pattern, f"Dân tộc: {data['Dân tộc']}")
+                break
+    
+    if 'Quốc tịch:' in cell.text and data.get('Quốc tịch'):
+        patterns = ['Quốc tịch: …………….', 'Quốc tịch:…………….']
+        for pattern in patterns:
+            if pattern in cell.text:
+                cell.text = cell.text.replace(pattern, f"Quốc tịch: {data['Quốc tịch']}")
+                break
+    
+    # Fill other fields
+    for field_name, data_key in FIELD_MAPPINGS:
+        if field_name in cell_text and data.get(data_key):
+            # Simple pattern like original code
+            pattern = field_name.replace(':', r':\s*[.…………]+')
+            cell.text = re.sub(pattern, f"{field_name} {data[data_key]}", cell_text, count=1)
+
+def format_document(doc):
+    """
+    Định dạng font và căn lề cho các ô trong bảng
+    
+    Args:
+        doc (Document): Văn bản đã điền dữ liệu
+    """
+    try:
         for table in doc.tables:
             for row in table.rows:
                 for cell in row.cells:
-                    try:
-                        cell_text = cell.text
-                        
-                        # Replace specific patterns
-                        if 'Số:' in cell_text and data.get('Số'):
-                            cell.text = re.sub(r'Số:\s*[.………_\-]+', f"Số: {data['Số']}", cell_text, count=1)
-                        
-                        if 'Ngày, tháng, năm cấp:' in cell_text and data.get('Ngày cấp'):
-                            cell.text = re.sub(r'Ngày, tháng, năm cấp:\s*[.………/\-]+', f"Ngày, tháng, năm cấp: {data['Ngày cấp']}", cell_text, count=1)
+                    for paragraph in cell.paragraphs:
+                        # Căn phải cho ngày cấp
+                        if 'Ngày, tháng, năm cấp:' in cell.text:
+                            paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
                         
-                        if 'Họ, chữ đệm, tên:' in cell_text and data.get('Họ tên'):
-                            cell.text = re.sub(r'Họ, chữ đệm, tên:\s*[.…………]+', f"Họ, chữ đệm, tên: {data['Họ tên']}", cell_text)
-                        
-                        if 'Họ, chữ đệm, tên, chức vụ người ký' in cell_text and data.get('Người ký'):
-                            cell.text = re.sub(r'Họ, chữ đệm, tên, chức vụ người ký[^:]*:\s*[.…………]+', f"Họ, chữ đệm, tên, chức vụ người ký Giấy xác nhận tình trạng hôn nhân: {data['Người ký']}", cell_text, count=1)
-                        
-                        # Flexible string replacement for different dot formats
-                        if 'Giới tính:' in cell_text and data.get('Giới tính'):
-                            # Try multiple dot patterns
-                            patterns = ['Giới tính: …………….', 'Giới tính:…………….']
-                            for pattern in patterns:
-                                if pattern in cell_text:
-                                    cell.text = cell_text.replace(pattern, f"Giới tính: {data['Giới tính']}")
-                                    break
-                        
-                        if 'Dân tộc:' in cell.text and data.get('Dân tộc'):
-                            patterns = ['Dân tộc: …………….', 'Dân tộc:…………….']
-                            for pattern in patterns:
-                                if pattern in cell.text:
-                                    cell.text = cell.text.replace(pattern, f"Dân tộc: {data['Dân tộc']}")
-                                    break
-                        
-                        if 'Quốc tịch:' in cell.text and data.get('Quốc tịch'):
-                            patterns = ['Quốc tịch: …………….', 'Quốc tịch:…………….']
-                            for pattern in patterns:
-                                if pattern in cell.text:
-                                    cell.text = cell.text.replace(pattern, f"Quốc tịch: {data['Quốc tịch']}")
-                                    break
-                        
-                        # Fill other fields
-                        field_mappings = [
-                            ('Ngày, tháng, năm sinh:', 'Ngày sinh'),
-                            ('Nơi cưu trú:', 'Nơi cư trú'),
-                            ('Giấy tờ tùy thân:', 'Giấy tờ tùy thân'),
-                            ('Tình trạng hôn nhân:', 'Tình trạng hôn nhân'),
-                            ('Mục đích sử dụng:', 'Mục đích sử dụng')
-                        ]
-                        
-                        for field_name, data_key in field_mappings:
-                            if field_name in cell_text and data.get(data_key):
-                                # Simple pattern like original code
-                                pattern = field_name.replace(':', r':\s*[.…………]+')
-                                cell.text = re.sub(pattern, f"{field_name} {data[data_key]}", cell_text, count=1)
-                    except:
-                        continue
-        
-        # Set font formatting
+                        for run in paragraph.runs:
+                            try:
+                                run.font.name = 'Times New Roman'
+                                run.font.size = Pt(13)
+                                if 'Họ, chữ đệm, tên, chức vụ người ký' in cell.text:
+                                    run.font.bold = True
+                            except:
+                                continue
+    except:
+        pass
+
+def build_filled_document(compiled, data):
+    """
+    Tạo văn bản đã điền dữ liệu trong bộ nhớ theo template đã biên dịch
+    
+    Args:
+        compiled (dict): Template đã biên dịch
+        data (dict): Dữ liệu cần điền
+    
+    Returns:
+        Document: Văn bản đã điền và định dạng
+    """
+    doc = Document(BytesIO(compiled['bytes']))
+    
+    # Chỉ điền các ô đã xác định trong kế hoạch điền
+    tables = doc.tables
+    table_cells = {}
+    for table_index, cell_index in compiled['plan']:
         try:
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for paragraph in cell.paragraphs:
-                            # Căn phải cho ngày cấp
-                            if 'Ngày, tháng, năm cấp:' in cell.text:
-                                paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-                            
-                            for run in paragraph.runs:
-                                try:
-                                    run.font.name = 'Times New Roman'
-                                    run.font.size = Pt(13)
-                                    if 'Họ, chữ đệm, tên, chức vụ người ký' in cell.text:
-                                        run.font.bold = True
-                                except:
-                                    continue
+            if table_index not in table_cells:
+                table_cells[table_index] = tables[table_index]._cells
+            fill_cell(table_cells[table_index][cell_index], data)
         except:
-            pass
+            continue
+    
+    format_document(doc)
+    return doc
+
+def get_output_cache_key(compiled, data):
+    """
+    Tạo khóa cache output từ dữ liệu bản ghi và nội dung template
+    
+    Các khóa nội bộ (tên file, thứ tự...) không ảnh hưởng tới nội dung điền
+    nên được bỏ qua; các trường được sắp xếp theo tên.
+    
+    Args:
+        compiled (dict): Template đã biên dịch
+        data (dict): Dữ liệu cần điền
+    
+    Returns:
+        str: Khóa cache
+    """
+    fields = {
+        key: value.strip() if isinstance(value, str) else value
+        for key, value in data.items() if key not in INTERNAL_KEYS
+    }
+    record_json = json.dumps(fields, ensure_ascii=False, sort_keys=True)
+    return compute_content_hash((compiled['content_hash'] + record_json).encode('utf-8'))
+
+def render_filled_document(compiled, data):
+    """
+    Điền dữ liệu và trả về nội dung .docx, dùng lại kết quả đã có trong cache
+    
+    Args:
+        compiled (dict): Template đã biên dịch
+        data (dict): Dữ liệu cần điền
+    
+    Returns:
+        bytes: Nội dung file .docx
+    """
+    cache = get_output_cache()
+    cache_key = get_output_cache_key(compiled, data)
+    
+    docx_bytes = lru_cache_get(cache, cache_key)
+    if docx_bytes is not None:
+        return docx_bytes
+    
+    doc = build_filled_document(compiled, data)
+    output = BytesIO()
+    save_filled_document(compiled, doc, output)
+    docx_bytes = output.getvalue()
+    
+    lru_cache_put(cache, cache_key, docx_bytes, len(docx_bytes), OUTPUT_CACHE_MAX_BYTES)
+    return docx_bytes
+
+def fill_compiled_template(compiled, data, output_docx_path):
+    """
+    Điền dữ liệu theo template đã biên dịch
+    
+    Args:
+        compiled (dict): Template đã biên dịch
+        data (dict): Dữ liệu cần điền
+        output_docx_path (str): Đường dẫn file output
         
-        doc.save(output_docx_path)
+    Returns:
+        bool: True nếu thành công
+    """
+    try:
+        docx_bytes = render_filled_document(compiled, data)
+        with open(output_docx_path, 'wb') as f:
+            f.write(docx_bytes)
         return True
         
     except Exception:
         return False
 
+def build_merged_document(template_path, data_list, status_placeholder=None):
+    """
+    Gộp nhiều bản ghi vào một văn bản duy nhất để in, ngắt trang giữa các giấy
+    
+    Đi một lượt qua thân văn bản đã điền của từng bản ghi và chuyển thẳng
+    các phần tử sang văn bản gộp. Bản ghi vừa điền trong batch được lấy từ
+    cache output (chỉ parse lại word/document.xml), bản ghi không còn trong
+    cache thì điền lại trong bộ nhớ; không đọc lại file đã lưu. Mỗi bản ghi
+    giữ một slot xử lý riêng để không chiếm slot của session khác suốt cả
+    nhóm. Chi phí tăng tuyến tính theo số bản ghi.
+    
+    Args:
+        template_path (str): Đường dẫn file template dùng chung
+        data_list (list): Danh sách dữ liệu cần điền
+        status_placeholder: st.empty() để hiển thị vị trí hàng đợi (tùy chọn)
+    
+    Returns:
+        tuple: (docx_bytes, số bản ghi đã gộp), docx_bytes là None nếu lỗi
+    """
+    compiled = get_compiled_template(template_path)
+    if not compiled or not data_list:
+        return None, 0
+    
+    output_cache = get_output_cache()
+    merged_doc = None
+    merged_count = 0
+    
+    for data in data_list:
+        with admission_slot(status_placeholder, 'Đang tạo bản in gộp'):
+            try:
+                docx_bytes = lru_cache_get(output_cache, get_output_cache_key(compiled, data))
+                if merged_doc is None:
+                    # Bản ghi đầu tiên làm văn bản gốc (giữ styles, section, header/footer)
+                    if docx_bytes is not None:
+                        merged_doc = Document(BytesIO(docx_bytes))
+                    else:
+                        merged_doc = build_filled_document(compiled, data)
+                    merged_body = merged_doc.element.body
+                    section_properties = merged_body.sectPr
+                    merged_count = 1
+                    continue
+                
+                if docx_bytes is not None:
+                    with zipfile.ZipFile(BytesIO(docx_bytes)) as package:
+                        body = parse_xml(package.read(compiled['main_part_name'])).find(qn('w:body'))
+                else:
+                    body = build_filled_document(compiled, data).element.body
+            except Exception:
+                continue
+            
+            # Ngắt trang trước mỗi giấy tiếp theo
+            merged_doc.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+            
+            for element in list(body):
+                if element.tag == qn('w:sectPr'):
+                    continue
+                if section_properties is not None:
+                    section_properties.addprevious(element)
+                else:
+                    merged_body.append(element)
+            merged_count += 1
+    
+    if merged_doc is None:
+        return None, 0
+    
+    output = BytesIO()
+    with admission_slot(status_placeholder, 'Đang tạo bản in gộp'):
+        save_filled_document(compiled, merged_doc, output)
+    return output.getvalue(), merged_count
+
+def fill_template(template_path, data, output_docx_path):
+    """
+    Điền dữ liệu vào template
+    
+    Args:
+        template_path (str): Đường dẫn file template
+        data (dict): Dữ liệu cần điền
+        output_docx_path (str): Đường dẫn file output
+    
+    Returns:
+        bool: True nếu thành công
+    """
+    compiled = get_compiled_template(template_path)
+    if not compiled:
+        return False
+    
+    return fill_compiled_template(compiled, data, output_docx_path)
+
+# =============================================================================
+# ADMISSION CONTROL FUNCTIONS
+# =============================================================================
+
+@st.cache_resource
+def get_admission_control():
+    """
+    Lấy bộ điều phối tác vụ nặng dùng chung cho mọi session
+    
+    Returns:
+        dict: Hàng đợi FIFO, số slot đang chạy và thời gian xử lý trung bình
+    """
+    return {
+        'condition': threading.Condition(),
+        'queue': deque(),  # Vé chờ theo thứ tự đến
+        'active': 0,
+        'avg_seconds': 1.0  # Trung bình trượt thời gian giữ slot
+    }
+
+@contextmanager
+def admission_slot(status_placeholder=None, status_message=None):
+    """
+    Chờ tới lượt rồi giữ một slot xử lý trong suốt khối lệnh
+    
+    Mỗi lần chỉ xin slot cho một file, nên session có nhiều file phải xếp
+    hàng lại sau mỗi file và không chiếm hết slot của session khác.
+    
+    Args:
+        status_placeholder: st.empty() để hiển thị vị trí hàng đợi (tùy chọn)
+        status_message (str): Nội dung hiển thị lại khi đã tới lượt
+    """
+    control = get_admission_control()
+    condition = control['condition']
+    ticket = object()
+    waited = False
+    
+    with condition:
+        control['queue'].append(ticket)
+        try:
+            while control['queue'][0] is not ticket or control['active'] >= ADMISSION_MAX_CONCURRENT:
+                if status_placeholder is not None:
+                    position = control['queue'].index(ticket) + 1
+                    estimated_wait = position * control['avg_seconds'] / ADMISSION_MAX_CONCURRENT
+                    status_placeholder.text(
+                        f"⏳ Server đang bận - vị trí trong hàng đợi: {position}, ước tính chờ ~{estimated_wait:.0f}s"
+                    )
+                waited = True
+                condition.wait(timeout=ADMISSION_POLL_SECONDS)
+        except BaseException:
+            # Session bị dừng khi đang chờ: bỏ vé để không chặn hàng đợi
+            control['queue'].remove(ticket)
+            condition.notify_all()
+            raise
+        
+        control['queue'].popleft()
+        control['active'] += 1
+        condition.notify_all()
+    
+    if waited and status_placeholder is not None and status_message:
+        status_placeholder.text(status_message)
+    
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with condition:
+            control['active'] -= 1
+            control['avg_seconds'] = 0.8 * control['avg_seconds'] + 0.2 * (time.perf_counter() - start)
+            condition.notify_all()
+
+# =============================================================================
+# CHECKPOINT JOURNAL FUNCTIONS
+# =============================================================================
+
+def get_batch_id(data_list):
+    """
+    Tạo mã batch ổn định từ nội dung các file input
+    
+    Cùng một bộ file upload lại sau khi server khởi động lại sẽ có cùng mã
+    batch, nhờ đó tìm lại được nhật ký của lần chạy trước.
+    
+    Args:
+        data_list (list): Danh sách dữ liệu hợp lệ (có content_hash)
+    
+    Returns:
+        str: Mã batch
+    """
+    batch_hash = hashlib.sha256()
+    for data in data_list:
+        batch_hash.update(data['content_hash'].encode('ascii'))
+    return batch_hash.hexdigest()[:16]
+
+def get_journal_path(batch_id):
+    """Đường dẫn file nhật ký của batch"""
+    return os.path.join(JOURNAL_DIR, batch_id, 'journal.jsonl')
+
+def cleanup_old_journals():
+    """Xóa nhật ký và file output của các batch quá hạn lưu giữ"""
+    if not os.path.isdir(JOURNAL_DIR):
+        return
+    
+    now = time.time()
+    for batch_id in os.listdir(JOURNAL_DIR):
+        batch_dir = os.path.join(JOURNAL_DIR, batch_id)
+        try:
+            if now - os.path.getmtime(batch_dir) < JOURNAL_RETENTION_SECONDS:
+                continue
+            for file_name in os.listdir(batch_dir):
+                os.remove(os.path.join(batch_dir, file_name))
+            os.rmdir(batch_dir)
+        except:
+            pass
+
+def load_journal(batch_id):
+    """
+    Đọc nhật ký batch, chỉ giữ các bản ghi đã hoàn thành còn file output
+    
+    Args:
+        batch_id (str): Mã batch
+    
+    Returns:
+        dict: input_hash -> bản ghi nhật ký
+    """
+    journal = {}
+    journal_path = get_journal_path(batch_id)
+    if not os.path.exists(journal_path):
+        return journal
+    
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Dòng cuối có thể bị ghi dở khi tiến trình bị dừng
+                continue
+            
+            if entry.get('status') == 'done' and os.path.exists(entry.get('output_path', '')):
+                journal[entry['input_hash']] = entry
+            else:
+                journal.pop(entry.get('input_hash'), None)
+    
+    return journal
+
+def append_journal_entry(batch_id, entry):
+    """
+    Ghi thêm một bản ghi vào nhật ký và đẩy xuống đĩa ngay
+    
+    Args:
+        batch_id (str): Mã batch
+        entry (dict): Bản ghi (input_hash, template_hash, output_path, status)
+    """
+    journal_path = get_journal_path(batch_id)
+    os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+    
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+def fill_record_with_journal(batch_id, journal, data, template_path):
+    """
+    Điền một bản ghi, bỏ qua nếu nhật ký cho thấy đã hoàn thành trước đó
+    
+    Args:
+        batch_id (str): Mã batch
+        journal (dict): Nhật ký đã đọc (load_journal)
+        data (dict): Dữ liệu cần điền
+        template_path (str): Đường dẫn file template
+    
+    Returns:
+        tuple: (output_path, resumed) - output_path là None nếu lỗi
+    """
+    compiled = get_compiled_template(template_path)
+    if not compiled:
+        return None, False
+    
+    input_hash = data['content_hash']
+    entry = journal.get(input_hash)
+    if entry and entry.get('template_hash') == compiled['content_hash']:
+        return entry['output_path'], True
+    
+    output_path = os.path.join(
+        JOURNAL_DIR, batch_id, f"{input_hash[:16]}_{compiled['content_hash'][:8]}.docx"
+    )
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    # Session khác xử lý cùng bộ file có thể đã ghi xong output này
+    # (tên file xác định bởi nội dung input và template nên nội dung giống nhau)
+    success = os.path.exists(output_path)
+    if not success:
+        # Ghi ra file tạm riêng của lần ghi này rồi đổi tên để không để lại
+        # file output ghi dở và không đụng file tạm của session khác
+        partial_path = f"{output_path}.{SESSION_ID}_{uuid.uuid4().hex[:8]}.part"
+        success = fill_compiled_template(compiled, data, partial_path)
+        if success:
+            os.replace(partial_path, output_path)
+        else:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            success = os.path.exists(output_path)
+    
+    entry = {
+        'input_hash': input_hash,
+        'template_hash': compiled['content_hash'],
+        'file_name': data.get('file_name', ''),
+        'output_path': output_path if success else '',
+        'status': 'done' if success else 'failed',
+        'time': int(time.time())
+    }
+    append_journal_entry(batch_id, entry)
+    journal[input_hash] = entry
+    
+    return (output_path if success else None), False
+
 # =============================================================================
 # STREAMLIT UI FUNCTIONS
 # =============================================================================
 
+def get_session_cache(name):
+    """
+    Lấy dict lưu trong st.session_state, giữ nguyên qua các lần chạy lại script
+    
+    Args:
+        name (str): Tên khóa trong session_state
+    
+    Returns:
+        dict: Dict của session hiện tại
+    """
+    if name not in st.session_state:
+        st.session_state[name] = {}
+    return st.session_state[name]
+
 def render_custom_css():
     """Render custom CSS cho giao diện"""
     st.markdown("""
@@ -602,22 +1664,26 @@ def render_file_upload_section():
     )
 
 def render_template_upload_section():
-    """Hiển thị thông tin template cố định"""
+    """Hiển thị danh sách template đã cài đặt"""
     st.markdown("<br>", unsafe_allow_html=True)
-    st.markdown("""
+    template_items = ''.join(
+        f"<li>{entry['name']}</li>" for entry in TEMPLATE_REGISTRY if os.path.exists(entry['path'])
+    )
+    st.markdown(f"""
     <div class="upload-section">
-        <h3>📋 Template Cố Định</h3>
-        <p> Tool sử dụng template được tối ưu hóa cho giấy xác nhận tình trạng hôn nhân</p>
+        <h3>📋 Template Cài Sẵn</h3>
+        <p> Tool tự động chọn template phù hợp theo loại giấy của từng file</p>
+        <ul>{template_items}</ul>
         <p> Không cần upload template - đã được cài đặt sẵn</p>
     </div>
     """, unsafe_allow_html=True)
     
-    # Trả về đường dẫn template cố định
-    return "temp/mau.docx"
+    # Trả về đường dẫn template mặc định
+    return select_template(DEFAULT_DOC_TYPE)
 
-def display_file_stats(valid_count, error_count):
+def display_file_stats(valid_count, error_count, duplicate_count=0):
     """Hiển thị thống kê file"""
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     with col1:
         st.markdown(f"""
         <div class="stats-card" style="background: #d4edda;">
@@ -634,55 +1700,145 @@ def display_file_stats(valid_count, error_count):
         </div>
         """, unsafe_allow_html=True)
 
-def display_data_details(data_list, error_list):
-    """Hiển thị chi tiết dữ liệu"""
-    if data_list:
-        with st.expander(f" Xem chi tiết {len(data_list)} file hợp lệ", expanded=False):
-            for i, data in enumerate(data_list):
-                st.markdown(f"**📄 {data['file_name']}**")
-                
-                col1, col2 = st.columns(2)
-                data_items = list(data.items())
-                mid = len(data_items) // 2
-                
-                with col1:
-                    for k, v in data_items[:mid]:
-                        if k not in ['file_name', 'file_index']:
-                            st.write(f"**{k}:** {v}")
-                
-                with col2:
-                    for k, v in data_items[mid:]:
-                        if k not in ['file_name', 'file_index']:
-                            st.write(f"**{k}:** {v}")
-                
-                if i < len(data_list) - 1:
-                    st.divider()
+    with col3:
+        st.markdown(f"""
+        <div class="stats-card" style="background: #fff3cd;">
+            <h3 style="color: #856404;">{duplicate_count}</h3>
+            <p>File trùng lặp</p>
+        </div>
+        """, unsafe_allow_html=True)
+
+def build_result_rows(data_list, error_list, duplicate_list):
+    """
+    Gộp kết quả trích xuất, lỗi và file trùng thành các dòng của bảng
+    
+    Args:
+        data_list (list): Danh sách dữ liệu hợp lệ
+        error_list (list): Danh sách file có lỗi
+        duplicate_list (list): Danh sách file trùng lặp
+    
+    Returns:
+        tuple: (rows, field_columns) - mỗi dòng là dict, kèm thứ tự cột dữ liệu
+    """
+    near_notes = {
+        dup['file_name']: f"Cùng Số và Họ tên với {dup['duplicate_of']}"
+        for dup in duplicate_list if dup['kind'] == 'near'
+    }
     
-    if error_list:
-        with st.expander(f"❌ Xem chi tiết {len(error_list)} file có lỗi", expanded=False):
-            for error_info in error_list:
+    # (file_name, trạng thái, lỗi, dữ liệu, ghi chú)
+    records = [
+        (data['file_name'], '✅ Hợp lệ', '', data, near_notes.get(data['file_name'], ''))
+        for data in data_list
+    ]
+    records += [
+        (error_info['file_name'], '❌ Lỗi', error_info['error'], error_info['data'] or {},
+         near_notes.get(error_info['file_name'], ''))
+        for error_info in error_list
+    ]
+    records += [
+        (dup['file_name'], '♻️ Trùng lặp', '', {},
+         f"Trùng hoàn toàn với {dup['duplicate_of']} - dùng lại kết quả, không xuất thêm file")
+        for dup in duplicate_list if dup['kind'] == 'exact'
+    ]
+    
+    field_columns = []
+    for _, _, _, data, _ in records:
+        for key in data:
+            if key not in INTERNAL_KEYS and key not in field_columns:
+                field_columns.append(key)
+    
+    rows = []
+    for file_name, status, error, data, note in records:
+        row = {'STT': len(rows) + 1, 'File': file_name, 'Trạng thái': status, 'Lỗi': error}
+        for key in field_columns:
+            row[key] = data.get(key, '')
+        row['Ghi chú'] = note
+        rows.append(row)
+    
+    return rows, field_columns
+
+@st.fragment
+def display_results_table(data_list, error_list, duplicate_list):
+    """
+    Hiển thị kết quả trong một bảng duy nhất có lọc, sắp xếp, phân trang
+    
+    Số widget không đổi theo số file: chỉ trang hiện tại được gửi xuống
+    trình duyệt, chi tiết chỉ hiển thị cho dòng được chọn. Chạy như một
+    fragment nên thao tác trên bảng chỉ chạy lại hàm này, không chạy lại
+    toàn bộ script.
+    """
+    rows, field_columns = build_result_rows(data_list, error_list, duplicate_list)
+    if not rows:
+        return
+    
+    with st.expander(f"📋 Xem kết quả {len(rows)} file", expanded=False):
+        col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
+        with col1:
+            search = st.text_input("Tìm kiếm", key="results_search", placeholder="Tên file, họ tên, số...")
+        with col2:
+            status_filter = st.selectbox(
+                "Trạng thái", ['Tất cả', '✅ Hợp lệ', '❌ Lỗi', '♻️ Trùng lặp'], key="results_status"
+            )
+        with col3:
+            sort_column = st.selectbox("Sắp xếp theo", ['STT', 'File', 'Trạng thái'] + field_columns, key="results_sort")
+        with col4:
+            sort_descending = st.checkbox("Giảm dần", key="results_sort_desc")
+        
+        # Lọc và sắp xếp trên toàn bộ kết quả trước khi phân trang
+        if status_filter != 'Tất cả':
+            rows = [row for row in rows if row['Trạng thái'] == status_filter]
+        if search:
+            keyword = search.strip().lower()
+            rows = [row for row in rows if any(keyword in str(value).lower() for value in row.values())]
+        rows = sorted(rows, key=lambda row: str(row.get(sort_column, '')) if sort_column != 'STT' else row['STT'],
+                      reverse=sort_descending)
+        
+        if not rows:
+            st.info("Không có kết quả phù hợp")
+            return
+        
+        page_count = (len(rows) + RESULTS_PAGE_SIZE - 1) // RESULTS_PAGE_SIZE
+        page = st.number_input(
+            f"Trang (tổng {page_count} trang, {len(rows)} dòng)",
+            min_value=1, max_value=page_count, value=1, step=1, key="results_page"
+        )
+        page_rows = rows[(page - 1) * RESULTS_PAGE_SIZE:page * RESULTS_PAGE_SIZE]
+        
+        st.dataframe(page_rows, use_container_width=True, hide_index=True)
+        
+        # Xem chi tiết một dòng
+        selected = st.selectbox(
+            "Xem chi tiết",
+            range(len(page_rows)),
+            format_func=lambda i: f"{page_rows[i]['STT']}. {page_rows[i]['File']}",
+            key="results_detail"
+        )
+        if selected is not None:
+            row = page_rows[selected]
+            if row['Lỗi']:
                 st.markdown(f"""
                 <div class="error-box">
-                    <h4>📄 {error_info['file_name']}</h4>
-                    <p><strong>Lỗi:</strong> {error_info['error']}</p>
+                    <h4>📄 {row['File']}</h4>
+                    <p><strong>Lỗi:</strong> {row['Lỗi']}</p>
                 </div>
                 """, unsafe_allow_html=True)
-                
-                if error_info['data']:
-                    st.write("**Dữ liệu đọc được (không đầy đủ):**")
-                    col1, col2 = st.columns(2)
-                    data_items = list(error_info['data'].items())
-                    mid = len(data_items) // 2
-                    
-                    with col1:
-                        for k, v in data_items[:mid]:
-                            if k not in ['file_name', 'file_index']:
-                                st.write(f"**{k}:** {v}")
-                    
-                    with col2:
-                        for k, v in data_items[mid:]:
-                            if k not in ['file_name', 'file_index']:
-                                st.write(f"**{k}:** {v}")
+            if row['Ghi chú']:
+                st.caption(row['Ghi chú'])
+            
+            details = [{'Trường': key, 'Giá trị': row[key]} for key in field_columns if row[key]]
+            if details:
+                st.dataframe(details, use_container_width=True, hide_index=True)
+
+def display_memory_stats(memory_stats):
+    """Hiển thị bộ nhớ đỉnh từng giai đoạn của batch"""
+    if not memory_stats:
+        return
+    
+    with st.expander("📊 Bộ nhớ sử dụng", expanded=False):
+        for stage in MEMORY_STAGES:
+            if stage in memory_stats:
+                st.write(f"**{stage}:** {memory_stats[stage] / (1024 * 1024):.1f} MB")
+        st.write(f"**Đỉnh của batch:** {memory_stats['batch'] / (1024 * 1024):.1f} MB / giới hạn {MEMORY_BUDGET // (1024 * 1024)} MB")
 
 def render_footer():
     """Render footer với hướng dẫn"""
@@ -697,7 +1853,7 @@ def render_footer():
             </div>
             <div style="background: white; padding: 1rem; border-radius: 8px; border-left: 4px solid #ffc107;">
                 <h4 style="color: #ffc107; margin: 0;">Bước 2</h4>
-                <p style="margin: 0.5rem 0 0 0;">Upload 1 file template dùng chung</p>
+                <p style="margin: 0.5rem 0 0 0;">Template được chọn tự động theo loại giấy</p>
             </div>
             <div style="background: white; padding: 1rem; border-radius: 8px; border-left: 4px solid #dc3545;">
                 <h4 style="color: #dc3545; margin: 0;">Bước 3</h4>
@@ -727,6 +1883,14 @@ def main():
     
     data_list = []
     error_list = []
+    duplicate_list = []
+    duplicate_index = create_duplicate_index()
+    extraction_cache = get_session_cache('extractions')
+    
+    # Đo bộ nhớ đỉnh từng giai đoạn của batch
+    memory_stats = {} if MEMORY_TRACKING else None
+    if MEMORY_TRACKING and not tracemalloc.is_tracing():
+        tracemalloc.start()
     
     if uploaded_inputs:
         # Validate file count
@@ -734,25 +1898,116 @@ def main():
             st.error(f"❌ Chỉ được upload tối đa {MAX_FILES} file!")
             uploaded_inputs = uploaded_inputs[:MAX_FILES]
         
+        # Hash toàn bộ file upload trước khi chia lượt: bản trùng hoàn toàn
+        # nằm ở hai lượt khác nhau vẫn được phát hiện và không xử lý hai lần
+        content_hashes = {}  # chỉ số file -> hash nội dung
+        unique_indices = []
+        for i, uploaded_file in enumerate(uploaded_inputs):
+            if uploaded_file.name.lower().endswith('.docx'):
+                with memory_stage(memory_stats, 'upload'):
+                    content_hashes[i] = compute_content_hash(uploaded_file.getvalue())
+                
+                # Bản trùng hoàn toàn: dùng lại kết quả, không trích xuất lại
+                original_name = register_upload(duplicate_index, content_hashes[i], uploaded_file.name)
+                if original_name:
+                    duplicate_list.append({
+                        'file_name': uploaded_file.name,
+                        'duplicate_of': original_name,
+                        'kind': 'exact'
+                    })
+                    continue
+            unique_indices.append(i)
+        
+        # Giới hạn bộ nhớ: từ chối file quá lớn, chia các file còn lại thành
+        # nhiều lượt nếu cả batch vượt giới hạn
+        default_template = get_compiled_template(select_template(DEFAULT_DOC_TYPE))
+        template_size = default_template['size'] if default_template else 1024 * 1024
+        chunks, rejected = plan_memory_budget(
+            [uploaded_inputs[i].size for i in unique_indices],
+            [get_xml_size(uploaded_inputs[i]) for i in unique_indices],
+            template_size
+        )
+        chunks = [[unique_indices[j] for j in chunk] for chunk in chunks]
+        rejected = [unique_indices[j] for j in rejected]
+        
+        for i in rejected:
+            error_list.append({
+                'file_name': uploaded_inputs[i].name,
+                'error': f"File quá lớn so với giới hạn bộ nhớ của server ({MEMORY_BUDGET // (1024 * 1024)}MB)",
+                'data': None
+            })
+        
+        # Lượt đang xử lý được giữ trong session, đặt lại khi danh sách upload thay đổi
+        chunk_state = get_session_cache('memory_chunks')
+        upload_key = tuple(uploaded_file.file_id for uploaded_file in uploaded_inputs)
+        if chunk_state.get('upload_key') != upload_key:
+            chunk_state['upload_key'] = upload_key
+            chunk_state['index'] = 0
+        chunk_index = min(chunk_state['index'], max(len(chunks) - 1, 0))
+        
+        if len(chunks) > 1:
+            chunk_names = ', '.join(uploaded_inputs[i].name for i in chunks[chunk_index])
+            st.warning(
+                f"⏸️ Chia thành {len(chunks)} lượt để không vượt giới hạn bộ nhớ. "
+                f"Đang xử lý lượt {chunk_index + 1}/{len(chunks)}: {chunk_names}"
+            )
+            if chunk_index + 1 < len(chunks) and st.button("⏭️ Chuyển sang lượt tiếp theo", key="next_memory_chunk"):
+                chunk_state['index'] = chunk_index + 1
+                st.session_state.pop('batch_result', None)
+                st.rerun()
+        
+        # File của các lượt trước đã trích xuất: ghi nhận để phát hiện trùng
+        # gần đúng (cùng Số và Họ tên) với file của lượt hiện tại
+        for chunk in chunks[:chunk_index]:
+            for i in chunk:
+                cached = extraction_cache.get(content_hashes.get(i))
+                if cached:
+                    register_extraction(duplicate_index, content_hashes[i], uploaded_inputs[i].name,
+                                        cached['data'], cached['error'])
+        
         # Process files with progress bar
         progress_bar = st.progress(0)
         status_text = st.empty()
+        chunk_indices = chunks[chunk_index] if chunks else []
         
-        for i, uploaded_file in enumerate(uploaded_inputs):
-            progress_bar.progress((i + 1) / len(uploaded_inputs))
+        for position, i in enumerate(chunk_indices):
+            uploaded_file = uploaded_inputs[i]
+            progress_bar.progress((position + 1) / len(chunk_indices))
             status_text.text(f'Đang xử lý: {uploaded_file.name}')
             
             if uploaded_file.name.lower().endswith('.docx'):
-                # Tạo tên file tạm thời unique
-                input_path = get_unique_temp_path(f"input_{i}")
+                content_hash = content_hashes[i]
+                
                 try:
-                    with open(input_path, "wb") as f:
-                        f.write(uploaded_file.getvalue())
+                    # Kết quả trích xuất được giữ trong session: các lần chạy lại
+                    # script (lọc bảng, tải file...) không trích xuất lại
+                    cached = extraction_cache.get(content_hash)
+                    if cached is None:
+                        # Tạo tên file tạm thời unique
+                        input_path = get_unique_temp_path(f"input_{i}")
+                        with memory_stage(memory_stats, 'upload'):
+                            with open(input_path, "wb") as f:
+                                f.write(uploaded_file.getvalue())
+                        
+                        with admission_slot(status_text, f'Đang xử lý: {uploaded_file.name}'):
+                            data, error = extract_data_from_input(input_path, memory_stats)
+                        cached = {'data': data, 'error': error}
+                        extraction_cache[content_hash] = cached
+                    
+                    data = dict(cached['data']) if cached['data'] else cached['data']
+                    error = cached['error']
+                    near_original = register_extraction(duplicate_index, content_hash, uploaded_file.name, data, error)
+                    if near_original:
+                        duplicate_list.append({
+                            'file_name': uploaded_file.name,
+                            'duplicate_of': near_original,
+                            'kind': 'near'
+                        })
                     
-                    data, error = extract_data_from_input(input_path)
                     if data and not error:
                         data['file_name'] = uploaded_file.name
                         data['file_index'] = i + 1
+                        data['content_hash'] = content_hash
                         data_list.append(data)
                     else:
                         error_info = {
@@ -779,9 +2034,15 @@ def main():
         progress_bar.empty()
         status_text.empty()
         
+        # Bỏ kết quả của các file không còn trong danh sách upload (giữ cho mọi lượt)
+        uploaded_hashes = set(content_hashes.values())
+        for content_hash in list(extraction_cache):
+            if content_hash not in uploaded_hashes:
+                del extraction_cache[content_hash]
+        
         # Display results
-        display_file_stats(len(data_list), len(error_list))
-        display_data_details(data_list, error_list)
+        display_file_stats(len(data_list), len(error_list), len(duplicate_list))
+        display_results_table(data_list, error_list, duplicate_list)
     
     # Step 2: Upload template
     uploaded_template = render_template_upload_section()
@@ -793,7 +2054,8 @@ def main():
         try:
             # Kiểm tra file template có tồn tại không
             if os.path.exists(template_path):
-                test_doc = Document(template_path)
+                if not get_compiled_template(template_path):
+                    raise ValueError(f"Không đọc được template: {template_path}")
                 st.markdown("""
                 <div class="success-box">
                     <h4>✅ Template đã sẵn sàng</h4>
@@ -851,48 +2113,84 @@ def main():
             zip_buffer = BytesIO()
             used_names = {}
             processed_files = []  # Tạo list để lưu file đã xử lý
+            failed_files = []  # (tên file, thông báo lỗi)
+            print_groups = {}  # template_path -> danh sách dữ liệu để in gộp
+            
+            # Nhật ký checkpoint: bỏ qua file đã hoàn thành ở lần chạy trước
+            cleanup_old_journals()
+            batch_id = get_batch_id(data_list)
+            journal = load_journal(batch_id)
+            resumed_count = 0
             
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                success_count = 0
+            for i, data in enumerate(data_list):
+                progress_bar.progress((i + 1) / len(data_list))
+                status_text.text(f'Đang xử lý: {data["file_name"]}')
                 
-                for i, data in enumerate(data_list):
-                    progress_bar.progress((i + 1) / len(data_list))
-                    status_text.text(f'Đang xử lý: {data["file_name"]}')
+                try:
+                    # Chọn template theo loại giấy của từng file
+                    record_template = select_template(data.get('doc_type')) or template_path
                     
-                    try:
-                        output_path = get_unique_temp_path(f"output_{i}")
+                    with admission_slot(status_text, f'Đang xử lý: {data["file_name"]}'):
+                        with memory_stage(memory_stats, 'fill'):
+                            output_path, resumed = fill_record_with_journal(batch_id, journal, data, record_template)
+                    
+                    if output_path:
+                        if resumed:
+                            resumed_count += 1
+                        
+                        # Generate unique filename với sanitize
+                        ho_ten = data.get('Họ tên', f'File_{data["file_index"]}')
+                        ho_ten_clean = sanitize_filename(ho_ten)
+                        base_name = f"{ho_ten_clean}_GiayXacNhan"
                         
-                        if fill_template(template_path, data, output_path):
-                            # Generate unique filename với sanitize
-                            ho_ten = data.get('Họ tên', f'File_{data["file_index"]}')
-                            ho_ten_clean = sanitize_filename(ho_ten)
-                            base_name = f"{ho_ten_clean}_GiayXacNhan"
-                            
-                            if base_name in used_names:
-                                used_names[base_name] += 1
-                                zip_filename = f"{base_name}_{used_names[base_name]}.docx"
-                            else:
-                                used_names[base_name] = 1
-                                zip_filename = f"{base_name}.docx"
-                            
-                            # Sanitize zip filename
-                            zip_filename = sanitize_filename(zip_filename)
-                            
-                            with open(output_path, 'rb') as f:
-                                zip_file.writestr(zip_filename, f.read())
-                            
-                            # Thêm vào processed_files
-                            processed_files.append((zip_filename, output_path))
-                            success_count += 1
+                        if base_name in used_names:
+                            used_names[base_name] += 1
+                            zip_filename = f"{base_name}_{used_names[base_name]}.docx"
                         else:
-                            st.error(f"❌ {data['file_name']}: Lỗi khi xử lý template")
-                    except Exception as e:
-                        st.error(f"❌ {data['file_name']}: {str(e)}")
+                            used_names[base_name] = 1
+                            zip_filename = f"{base_name}.docx"
+                        
+                        # Sanitize zip filename
+                        zip_filename = sanitize_filename(zip_filename)
+                        
+                        # Thêm vào processed_files
+                        processed_files.append((zip_filename, output_path))
+                        print_groups.setdefault(record_template, []).append(data)
+                    else:
+                        failed_files.append((data['file_name'], "Lỗi khi xử lý template"))
+                except Exception as e:
+                    failed_files.append((data['file_name'], str(e)))
+            
+            # Đóng gói ZIP từ các file output đã ghi nhật ký
+            with memory_stage(memory_stats, 'zip'):
+                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                    for zip_filename, output_path in processed_files:
+                        zip_file.write(output_path, zip_filename)
             
             progress_bar.empty()
             status_text.empty()
-            zip_buffer.seek(0)
             
+            # Lưu kết quả vào session để các lần chạy lại script (tải file,
+            # lọc bảng kết quả...) vẫn hiển thị mà không phải xử lý lại
+            st.session_state['batch_result'] = {
+                'batch_id': batch_id,
+                'processed_files': processed_files,
+                'failed_files': failed_files,
+                'zip_bytes': zip_buffer.getvalue(),
+                'print_groups': list(print_groups.items()),
+                'merged_files': None,  # Bản in gộp chỉ tạo khi người dùng yêu cầu
+                'resumed_count': resumed_count
+            }
+        
+        batch_result = st.session_state.get('batch_result')
+        if batch_result and batch_result['batch_id'] == get_batch_id(data_list):
+            for file_name, error in batch_result['failed_files']:
+                st.error(f"❌ {file_name}: {error}")
+            
+            if batch_result['resumed_count']:
+                st.info(f"♻️ Tiếp tục từ lần chạy trước: {batch_result['resumed_count']} file đã hoàn thành được dùng lại")
+            
+            success_count = len(batch_result['processed_files'])
             if success_count > 0:
                 st.markdown(f"""
                 <div class="success-box">
@@ -902,7 +2200,7 @@ def main():
                 """, unsafe_allow_html=True)
                 
                 # Chỉ lấy file thành công (loại bỏ file lỗi)
-                success_files = [(name, path) for name, path in processed_files if os.path.exists(path)]
+                success_files = [(name, path) for name, path in batch_result['processed_files'] if os.path.exists(path)]
                 
                 if success_files:
                     # Nút xuất tất cả (chỉ file thành công)
@@ -912,11 +2210,44 @@ def main():
                     with col1:
                         st.download_button(
                             f"📄 Tải Tất Cả DOCX ({len(success_files)} file)",
-                            zip_buffer.getvalue(),
+                            batch_result['zip_bytes'],
                             file_name="GiayXacNhan_DOCX.zip",
                             mime="application/zip",
                             use_container_width=True
                         )
+                    
+                    with col2:
+                        if batch_result['merged_files'] is None and st.button(
+                            "🖨️ Tạo Bản In Gộp", use_container_width=True, key="build_merged"
+                        ):
+                            # Bản in gộp: mỗi template một file, các giấy cách nhau bằng ngắt trang
+                            merge_status = st.empty()
+                            merged_files = []
+                            for group_index, (group_template, group_data) in enumerate(batch_result['print_groups']):
+                                merge_status.text('Đang tạo bản in gộp')
+                                with memory_stage(memory_stats, 'merge'):
+                                    merged_bytes, merged_count = build_merged_document(
+                                        group_template, group_data, merge_status
+                                    )
+                                if merged_count < len(group_data):
+                                    st.error(f"❌ Bản in gộp thiếu {len(group_data) - merged_count}/{len(group_data)} giấy không điền được")
+                                if merged_bytes:
+                                    suffix = f"_{group_index + 1}" if len(batch_result['print_groups']) > 1 else ""
+                                    merged_files.append((f"GiayXacNhan_InGop{suffix}.docx", merged_bytes, merged_count))
+                            merge_status.empty()
+                            batch_result['merged_files'] = merged_files or None
+                            if not merged_files:
+                                st.error("❌ Không tạo được bản in gộp")
+                        
+                        for merged_name, merged_bytes, merged_count in batch_result['merged_files'] or []:
+                            st.download_button(
+                                f"🖨️ Tải Bản In Gộp ({merged_count} giấy)",
+                                merged_bytes,
+                                file_name=merged_name,
+                                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                                use_container_width=True,
+                                key=f"download_merged_{merged_name}"
+                            )
                 
                     
                     # Tải từng file riêng lẻ (chỉ file thành công)
@@ -957,7 +2288,7 @@ def main():
         st.markdown("""
         <div class="info-box">
             <h3>⏳ Chờ Template</h3>
-            <p>Vui lòng upload file template để tiếp tục</p>
+            <p>Không tìm thấy template cài sẵn, vui lòng kiểm tra thư mục temp</p>
         </div>
         """, unsafe_allow_html=True)
     elif not data_list and template_path:
@@ -979,10 +2310,12 @@ def main():
         st.markdown("""
         <div class="info-box">
             <h3>🚀 Bắt Đầu</h3>
-            <p>Vui lòng upload file dữ liệu và template để bắt đầu</p>
+            <p>Vui lòng upload file dữ liệu để bắt đầu</p>
         </div>
         """, unsafe_allow_html=True)
     
+    display_memory_stats(memory_stats)
+    
     # Render footer
     render_footer()
 
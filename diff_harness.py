@@ -0,0 +1,245 @@
+"""
+=============================================================================
+DIFF HARNESS - SO SÁNH ENGINE TRÍCH XUẤT/ĐIỀN THAY THẾ
+=============================================================================
+Chạy song song bản cài đặt tham chiếu trong app_batch_refactored.py và
+một engine ứng viên trên cùng một bộ file mẫu, so sánh:
+    - dict dữ liệu của extract_data_from_input
+    - kết quả của find_person_signature
+    - nội dung word/document.xml do fill_template sinh ra
+và báo cáo các điểm khác biệt cùng tốc độ tương đối.
+
+Engine ứng viên là một module Python có thể định nghĩa bất kỳ hàm nào
+trong số extract_data_from_input, find_person_signature, fill_template
+(cùng chữ ký với bản tham chiếu). Hàm nào không có sẽ không được so sánh.
+
+Cách dùng:
+    python diff_harness.py --candidate fast_engine --corpus mau_thu --repeat 3
+=============================================================================
+"""
+
+import argparse
+import glob
+import importlib
+import logging
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+ENGINE_FUNCTIONS = ['extract_data_from_input', 'find_person_signature', 'fill_template']
+DIFF_CONTEXT = 80  # Số ký tự hiển thị quanh vị trí khác biệt
+
+# =============================================================================
+# ENGINE LOADING
+# =============================================================================
+
+def load_engines(candidate_name):
+    """
+    Nạp module tham chiếu và module ứng viên
+    
+    Args:
+        candidate_name (str): Tên module hoặc đường dẫn file .py của engine ứng viên
+    
+    Returns:
+        tuple: (reference_module, candidate_module, danh sách hàm được so sánh)
+    """
+    # Tắt cảnh báo bare mode của Streamlit khi import app
+    logging.disable(logging.WARNING)
+    sys.path.insert(0, APP_DIR)
+    reference = importlib.import_module('app_batch_refactored')
+    # Tắt cache output để đo đúng thời gian điền của bản tham chiếu
+    reference.OUTPUT_CACHE_MAX_BYTES = 0
+    
+    if candidate_name.endswith('.py'):
+        sys.path.insert(0, os.path.dirname(os.path.abspath(candidate_name)))
+        candidate_name = os.path.splitext(os.path.basename(candidate_name))[0]
+    candidate = importlib.import_module(candidate_name)
+    
+    compared = [name for name in ENGINE_FUNCTIONS if callable(getattr(candidate, name, None))]
+    return reference, candidate, compared
+
+def timed_call(timings, key, func, *args):
+    """Gọi hàm và cộng dồn thời gian chạy vào timings[key]"""
+    start = time.perf_counter()
+    result = func(*args)
+    timings[key] = timings.get(key, 0.0) + time.perf_counter() - start
+    return result
+
+# =============================================================================
+# DIFF FUNCTIONS
+# =============================================================================
+
+def diff_dicts(reference_data, candidate_data, ignored_keys=()):
+    """
+    So sánh hai dict dữ liệu trích xuất
+    
+    Args:
+        reference_data (dict): Dữ liệu từ bản tham chiếu
+        candidate_data (dict): Dữ liệu từ engine ứng viên
+        ignored_keys (list): Các khóa nội bộ không so sánh (doc_type...)
+    
+    Returns:
+        list: Danh sách mô tả các trường khác nhau
+    """
+    reference_data = reference_data or {}
+    candidate_data = candidate_data or {}
+    differences = []
+    
+    for key in sorted((set(reference_data) | set(candidate_data)) - set(ignored_keys)):
+        if key not in candidate_data:
+            differences.append(f"thiếu trường '{key}'")
+        elif key not in reference_data:
+            differences.append(f"thừa trường '{key}'")
+        elif reference_data[key] != candidate_data[key]:
+            differences.append(f"'{key}': {reference_data[key]!r} != {candidate_data[key]!r}")
+    
+    return differences
+
+def read_document_xml(docx_path):
+    """Đọc nội dung word/document.xml của file .docx"""
+    with zipfile.ZipFile(docx_path) as package:
+        return package.read('word/document.xml').decode('utf-8')
+
+def diff_text(reference_text, candidate_text):
+    """
+    Tìm vị trí khác biệt đầu tiên giữa hai chuỗi
+    
+    Returns:
+        str: Mô tả khác biệt kèm ngữ cảnh, hoặc None nếu giống nhau
+    """
+    if reference_text == candidate_text:
+        return None
+    
+    position = 0
+    for position, (a, b) in enumerate(zip(reference_text, candidate_text)):
+        if a != b:
+            break
+    else:
+        position = min(len(reference_text), len(candidate_text))
+    
+    start = max(0, position - DIFF_CONTEXT // 2)
+    return (
+        f"khác tại ký tự {position} (độ dài {len(reference_text)} / {len(candidate_text)})\n"
+        f"        tham chiếu: {reference_text[start:start + DIFF_CONTEXT]!r}\n"
+        f"        ứng viên:   {candidate_text[start:start + DIFF_CONTEXT]!r}"
+    )
+
+# =============================================================================
+# CORPUS RUN
+# =============================================================================
+
+def compare_file(input_path, reference, candidate, compared, template_path, work_dir, timings):
+    """
+    So sánh các engine trên một file input
+    
+    Returns:
+        list: Danh sách khác biệt của file
+    """
+    mismatches = []
+    
+    # extract_data_from_input
+    ref_data, ref_error = timed_call(timings, ('ref', 'extract_data_from_input'),
+                                     reference.extract_data_from_input, input_path)
+    if 'extract_data_from_input' in compared:
+        cand_data, cand_error = timed_call(timings, ('cand', 'extract_data_from_input'),
+                                           candidate.extract_data_from_input, input_path)
+        for difference in diff_dicts(ref_data, cand_data, reference.INTERNAL_KEYS):
+            mismatches.append(f"extract: {difference}")
+        if ref_error != cand_error:
+            mismatches.append(f"extract: lỗi {ref_error!r} != {cand_error!r}")
+    
+    # find_person_signature
+    if 'find_person_signature' in compared:
+        try:
+            all_text = reference.extract_text_from_document(input_path)
+        except Exception:
+            all_text = None
+        
+        if all_text is not None:
+            ref_signature = timed_call(timings, ('ref', 'find_person_signature'),
+                                       reference.find_person_signature, all_text)
+            cand_signature = timed_call(timings, ('cand', 'find_person_signature'),
+                                        candidate.find_person_signature, all_text)
+            if ref_signature != cand_signature:
+                mismatches.append(f"signature: {ref_signature!r} != {cand_signature!r}")
+    
+    # fill_template - cả hai engine nhận cùng dữ liệu tham chiếu
+    if 'fill_template' in compared and ref_data:
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        ref_output = os.path.join(work_dir, f"{base_name}_ref.docx")
+        cand_output = os.path.join(work_dir, f"{base_name}_cand.docx")
+        
+        ref_ok = timed_call(timings, ('ref', 'fill_template'),
+                            reference.fill_template, template_path, dict(ref_data), ref_output)
+        cand_ok = timed_call(timings, ('cand', 'fill_template'),
+                             candidate.fill_template, template_path, dict(ref_data), cand_output)
+        
+        if ref_ok != cand_ok:
+            mismatches.append(f"fill: kết quả {ref_ok} != {cand_ok}")
+        elif ref_ok:
+            difference = diff_text(read_document_xml(ref_output), read_document_xml(cand_output))
+            if difference:
+                mismatches.append(f"fill: word/document.xml {difference}")
+    
+    return mismatches
+
+def print_speed_report(timings, compared, repeat):
+    """In bảng so sánh tốc độ"""
+    print("-" * 77)
+    print(f"{'Hàm':<26}{'Tham chiếu':>14}{'Ứng viên':>14}{'Tăng tốc':>12}")
+    for name in compared:
+        ref_time = timings.get(('ref', name), 0.0) / repeat
+        cand_time = timings.get(('cand', name), 0.0) / repeat
+        speedup = f"{ref_time / cand_time:.2f}x" if cand_time else "-"
+        print(f"{name:<26}{ref_time * 1000:>12.1f}ms{cand_time * 1000:>12.1f}ms{speedup:>12}")
+
+def main():
+    """Hàm chính của diff harness"""
+    parser = argparse.ArgumentParser(description="So sánh kết quả và tốc độ của engine trích xuất/điền thay thế")
+    parser.add_argument('--candidate', required=True, help="Tên module hoặc file .py của engine ứng viên")
+    parser.add_argument('--corpus', required=True, help="Thư mục chứa file .docx mẫu")
+    parser.add_argument('--template', default=None, help="File template (mặc định: template cài sẵn)")
+    parser.add_argument('--repeat', type=int, default=1, help="Số lần chạy lặp để đo tốc độ")
+    args = parser.parse_args()
+    
+    corpus = sorted(glob.glob(os.path.join(os.path.abspath(args.corpus), '*.docx')))
+    if not corpus:
+        raise SystemExit(f"Không tìm thấy file .docx trong {args.corpus}")
+    template_arg = os.path.abspath(args.template) if args.template else None
+    
+    # App dùng đường dẫn template tương đối (temp/mau.docx)
+    os.chdir(APP_DIR)
+    reference, candidate, compared = load_engines(args.candidate)
+    if not compared:
+        raise SystemExit(f"Module {args.candidate} không định nghĩa hàm nào trong {ENGINE_FUNCTIONS}")
+    
+    template_path = template_arg or reference.select_template(reference.DEFAULT_DOC_TYPE)
+    timings = {}
+    all_mismatches = {}
+    
+    with tempfile.TemporaryDirectory() as work_dir:
+        for run in range(args.repeat):
+            for input_path in corpus:
+                mismatches = compare_file(input_path, reference, candidate, compared,
+                                          template_path, work_dir, timings)
+                # Kết quả là tất định, chỉ cần ghi nhận ở lần chạy đầu
+                if run == 0 and mismatches:
+                    all_mismatches[os.path.basename(input_path)] = mismatches
+    
+    print("=" * 77)
+    print(f"Corpus: {len(corpus)} file, so sánh: {', '.join(compared)}")
+    for file_name, mismatches in all_mismatches.items():
+        print(f"❌ {file_name}")
+        for mismatch in mismatches:
+            print(f"    {mismatch}")
+    print(f"Khớp: {len(corpus) - len(all_mismatches)}/{len(corpus)} file")
+    print_speed_report(timings, compared, args.repeat)
+    print("=" * 77)
+    
+    sys.exit(1 if all_mismatches else 0)
+
+if __name__ == "__main__":
+    main()
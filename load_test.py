@@ -0,0 +1,276 @@
+"""
+=============================================================================
+LOAD TEST - MÔ PHỎNG NHIỀU SESSION ĐỒNG THỜI
+=============================================================================
+Chạy N session giả lập đồng thời trên app_batch_refactored.py qua API
+kiểm thử của Streamlit (AppTest): upload file -> xử lý -> tải về.
+Báo cáo độ trễ (p50/p90/p95/p99), thông lượng và RSS đỉnh để ước
+lượng cấu hình server.
+
+Mỗi file upload được sửa Số giấy để có nội dung riêng, app dùng thư mục
+nhật ký tạm và tắt cache output, nên mọi session đều điền thật thay vì
+dùng lại kết quả của session khác hoặc của lần chạy trước.
+
+Cách dùng:
+    python load_test.py --sessions 10 --files-per-session 5 --input-dir mau_thu
+=============================================================================
+"""
+
+import argparse
+import glob
+import io
+import logging
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from streamlit.testing.v1 import AppTest
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app_batch_refactored.py')
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# =============================================================================
+# SESSION SIMULATION
+# =============================================================================
+
+def run_session(session_index, input_files, timeout):
+    """
+    Mô phỏng một người dùng: upload file, nhấn 'Xử Lý' và nhận nút tải về
+    
+    Args:
+        session_index (int): Số thứ tự session
+        input_files (list): Danh sách (tên file, nội dung bytes)
+        timeout (float): Thời gian chờ tối đa mỗi lần chạy script (giây)
+    
+    Returns:
+        dict: Kết quả đo của session
+    """
+    result = {
+        'session': session_index,
+        'upload_latency': None,
+        'process_latency': None,
+        'total_latency': None,
+        'downloads': 0,
+        'error': None
+    }
+    start = time.perf_counter()
+    
+    try:
+        at = AppTest.from_file(APP_FILE, default_timeout=timeout)
+        at.run()
+        
+        # Bước 1: upload và trích xuất dữ liệu
+        uploader = at.file_uploader[0]
+        for file_name, content in input_files:
+            uploader.upload(file_name, content, DOCX_MIME)
+        
+        upload_start = time.perf_counter()
+        uploader.run()
+        result['upload_latency'] = time.perf_counter() - upload_start
+        
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        
+        # Bước 3: nhấn nút xử lý
+        process_buttons = [b for b in at.button if 'Xử Lý' in b.label]
+        if not process_buttons:
+            raise RuntimeError("Không có nút Xử Lý (không có file hợp lệ?)")
+        
+        process_start = time.perf_counter()
+        process_buttons[0].click().run()
+        result['process_latency'] = time.perf_counter() - process_start
+        
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        
+        result['downloads'] = len(at.get('download_button'))
+        if result['downloads'] == 0:
+            raise RuntimeError("Không có file nào để tải về")
+    
+    except Exception as e:
+        result['error'] = str(e)
+    
+    result['total_latency'] = time.perf_counter() - start
+    return result
+
+# =============================================================================
+# REPORTING
+# =============================================================================
+
+def percentile(values, percent):
+    """
+    Tính phân vị theo phương pháp nearest-rank
+    
+    Args:
+        values (list): Danh sách giá trị
+        percent (float): Phân vị cần tính (0-100)
+    
+    Returns:
+        float: Giá trị phân vị, hoặc None nếu danh sách rỗng
+    """
+    if not values:
+        return None
+    
+    ordered = sorted(values)
+    rank = max(1, int(round(percent / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def format_latency_row(label, values):
+    """Định dạng một dòng thống kê độ trễ"""
+    if not values:
+        return f"{label:<12} (không có dữ liệu)"
+    
+    return (
+        f"{label:<12} p50={percentile(values, 50):7.2f}s  p90={percentile(values, 90):7.2f}s  "
+        f"p95={percentile(values, 95):7.2f}s  p99={percentile(values, 99):7.2f}s  "
+        f"max={max(values):7.2f}s  mean={statistics.mean(values):7.2f}s"
+    )
+
+def get_peak_rss_mb():
+    """Lấy RSS đỉnh của tiến trình (MB), None nếu hệ điều hành không hỗ trợ"""
+    if resource is None:
+        return None
+    
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về bytes
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+def print_report(results, wall_time, files_per_session):
+    """In báo cáo tổng hợp"""
+    ok_results = [r for r in results if not r['error']]
+    failed = [r for r in results if r['error']]
+    processed_files = sum(r['downloads'] for r in ok_results)
+    
+    print("=" * 77)
+    print(f"Sessions: {len(results)} (thành công {len(ok_results)}, lỗi {len(failed)})")
+    print(f"File mỗi session: {files_per_session}")
+    print(f"Thời gian tổng: {wall_time:.2f}s")
+    print("-" * 77)
+    print(format_latency_row("Upload", [r['upload_latency'] for r in ok_results]))
+    print(format_latency_row("Xử lý", [r['process_latency'] for r in ok_results]))
+    print(format_latency_row("Toàn bộ", [r['total_latency'] for r in ok_results]))
+    print("-" * 77)
+    print(f"Thông lượng: {len(ok_results) / wall_time:.2f} session/s, "
+          f"{len(ok_results) * files_per_session / wall_time:.2f} file/s "
+          f"({processed_files} nút tải về)")
+    peak_rss = get_peak_rss_mb()
+    if peak_rss is not None:
+        print(f"RSS đỉnh của tiến trình: {peak_rss:.1f} MB")
+    
+    for r in failed:
+        print(f"❌ Session {r['session']}: {r['error']}")
+    print("=" * 77)
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def load_input_files(input_dir, files_per_session):
+    """
+    Đọc các file .docx mẫu, lặp lại vòng tròn nếu không đủ số lượng
+    
+    Args:
+        input_dir (str): Thư mục chứa file .docx mẫu
+        files_per_session (int): Số file mỗi session
+    
+    Returns:
+        list: Danh sách (tên file, nội dung bytes)
+    """
+    paths = sorted(glob.glob(os.path.join(input_dir, '*.docx')))
+    if not paths:
+        raise SystemExit(f"Không tìm thấy file .docx trong {input_dir}")
+    
+    files = []
+    for i in range(files_per_session):
+        path = paths[i % len(paths)]
+        with open(path, 'rb') as f:
+            files.append((f"{i + 1}_{os.path.basename(path)}", f.read()))
+    return files
+
+def make_unique_input(content, tag):
+    """
+    Tạo bản sao file .docx có nội dung riêng cho một session
+    
+    Thêm tag vào sau Số giấy trong word/document.xml để dữ liệu trích xuất
+    khác nhau, và ghi tag vào comment của ZIP để hash nội dung luôn khác
+    nhau kể cả khi không tìm thấy Số.
+    
+    Args:
+        content (bytes): Nội dung file .docx gốc
+        tag (str): Chuỗi phân biệt (chỉ gồm chữ, số, '-')
+    
+    Returns:
+        bytes: Nội dung file .docx mới
+    """
+    output = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(content)) as source, \
+            zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            data = source.read(info)
+            if info.filename == 'word/document.xml':
+                document_xml = data.decode('utf-8')
+                document_xml = re.sub(r'(Số\s*:\s*)([\w/\-]+)', rf'\g<1>\g<2>-{tag}', document_xml, count=1)
+                data = document_xml.encode('utf-8')
+            target.writestr(info, data)
+        target.comment = f"load-test {tag}".encode('ascii')
+    return output.getvalue()
+
+def main():
+    """Hàm chính của load test"""
+    parser = argparse.ArgumentParser(description="Load test nhiều session đồng thời cho app Streamlit")
+    parser.add_argument('--sessions', type=int, default=5, help="Số session đồng thời")
+    parser.add_argument('--files-per-session', type=int, default=5, help="Số file upload mỗi session")
+    parser.add_argument('--input-dir', required=True, help="Thư mục chứa file .docx mẫu")
+    parser.add_argument('--timeout', type=float, default=300, help="Thời gian chờ tối đa mỗi lần chạy script (giây)")
+    args = parser.parse_args()
+    
+    # Tắt cảnh báo bare mode của Streamlit
+    logging.disable(logging.WARNING)
+    
+    input_files = load_input_files(args.input_dir, args.files_per_session)
+    session_files = {
+        session_index: [
+            (file_name, make_unique_input(content, f"LT{session_index}-{i + 1}"))
+            for i, (file_name, content) in enumerate(input_files)
+        ]
+        for session_index in range(1, args.sessions + 1)
+    }
+    
+    # App dùng đường dẫn template tương đối (temp/mau.docx)
+    os.chdir(os.path.dirname(APP_FILE))
+    
+    # Không đo bằng tracemalloc: làm chậm cả tiến trình và sai lệch độ trễ
+    barrier = threading.Barrier(args.sessions)
+    
+    def start_session(session_index):
+        # Cho tất cả session bắt đầu cùng lúc
+        barrier.wait()
+        return run_session(session_index, session_files[session_index], args.timeout)
+    
+    with tempfile.TemporaryDirectory() as journal_dir:
+        # Nhật ký riêng cho lần chạy và tắt cache output để mọi file đều được điền
+        os.environ['GXN_JOURNAL_DIR'] = journal_dir
+        os.environ['GXN_OUTPUT_CACHE_MB'] = '0'
+        
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+            results = list(executor.map(start_session, range(1, args.sessions + 1)))
+        wall_time = time.perf_counter() - wall_start
+    
+    print_report(results, wall_time, args.files_per_session)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+=============================================================================
+WATCH DAEMON - TỰ ĐỘNG XỬ LÝ FILE TRONG THƯ MỤC THEO DÕI
+=============================================================================
+Theo dõi thư mục input (máy scan, hệ thống tiếp nhận thả file .docx vào),
+gom file mới thành từng lô nhỏ theo số lượng hoặc khoảng thời gian, rồi
+trích xuất và điền template như trên giao diện web.
+
+    - File chỉ được nhận khi kích thước và thời gian sửa không đổi trong
+      khoảng --settle giây (tránh đọc file đang được ghi)
+    - Kết quả ghi vào thư mục output, báo lỗi từng file ghi vào output/errors/
+    - File input đã xử lý được chuyển vào input/processed/ hoặc input/failed/;
+      nếu không chuyển được (file bị khóa, thiếu quyền...) file được ghi nhớ
+      để không bị xử lý lại
+
+Cách dùng:
+    python watch_daemon.py --input-dir /srv/scan --output-dir /srv/ket_qua
+=============================================================================
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# =============================================================================
+# FILE WATCHING
+# =============================================================================
+
+def is_candidate_file(file_name):
+    """Chỉ nhận file .docx, bỏ qua file khóa của Word (~$) và file ẩn"""
+    return (
+        file_name.lower().endswith('.docx')
+        and not file_name.startswith('~$')
+        and not file_name.startswith('.')
+    )
+
+def scan_ready_files(input_dir, pending, settle_seconds, processed):
+    """
+    Quét thư mục input và trả về các file đã ghi xong
+    
+    Một file được coi là ghi xong khi kích thước và thời gian sửa không đổi
+    trong ít nhất settle_seconds giây.
+    
+    Args:
+        input_dir (str): Thư mục input
+        pending (dict): Trạng thái theo dõi: path -> (size, mtime, thấy lần đầu, ổn định từ)
+        settle_seconds (float): Thời gian file phải ổn định
+        processed (dict): File đã xử lý nhưng chưa chuyển đi được: path -> (size, mtime)
+    
+    Returns:
+        list: Danh sách (path, thời điểm thấy lần đầu) của file đã sẵn sàng
+    """
+    now = time.time()
+    ready = []
+    seen = set()
+    
+    for file_name in sorted(os.listdir(input_dir)):
+        path = os.path.join(input_dir, file_name)
+        if not is_candidate_file(file_name) or not os.path.isfile(path):
+            continue
+        
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        seen.add(path)
+        
+        signature = (stat.st_size, stat.st_mtime)
+        if processed.get(path) == signature:
+            continue
+        
+        previous = pending.get(path)
+        if previous is None or previous[:2] != signature:
+            # File mới hoặc vẫn đang được ghi: đặt lại mốc chờ
+            first_seen = previous[2] if previous else now
+            pending[path] = (signature[0], signature[1], first_seen, now)
+            continue
+        
+        size, mtime, first_seen, stable_since = previous
+        if size > 0 and now - stable_since >= settle_seconds:
+            ready.append((path, first_seen))
+    
+    # Bỏ theo dõi file đã bị xóa hoặc di chuyển
+    for path in list(pending):
+        if path not in seen:
+            del pending[path]
+    for path in list(processed):
+        if path not in seen:
+            del processed[path]
+    
+    return ready
+
+# =============================================================================
+# BATCH PROCESSING
+# =============================================================================
+
+def get_available_output_path(output_dir, base_name):
+    """Tạo đường dẫn output chưa tồn tại (thêm _2, _3... nếu trùng tên)"""
+    output_path = os.path.join(output_dir, f"{base_name}.docx")
+    counter = 1
+    while os.path.exists(output_path):
+        counter += 1
+        output_path = os.path.join(output_dir, f"{base_name}_{counter}.docx")
+    return output_path
+
+def write_error_report(output_dir, file_name, error, data):
+    """Ghi báo lỗi của một file vào output/errors/<tên file>.error.json"""
+    error_dir = os.path.join(output_dir, 'errors')
+    os.makedirs(error_dir, exist_ok=True)
+    
+    report = {
+        'file_name': file_name,
+        'error': error,
+        'data': data,
+        'time': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+    with open(os.path.join(error_dir, f"{file_name}.error.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+def move_input(input_path, target_dir):
+    """Chuyển file input đã xử lý sang thư mục processed/ hoặc failed/"""
+    os.makedirs(target_dir, exist_ok=True)
+    target_path = os.path.join(target_dir, os.path.basename(input_path))
+    if os.path.exists(target_path):
+        name, extension = os.path.splitext(os.path.basename(input_path))
+        target_path = os.path.join(target_dir, f"{name}_{int(time.time())}{extension}")
+    shutil.move(input_path, target_path)
+
+def process_file(app, input_path, output_dir):
+    """
+    Trích xuất và điền template cho một file
+    
+    Args:
+        app (module): Module app_batch_refactored
+        input_path (str): Đường dẫn file input
+        output_dir (str): Thư mục output
+    
+    Returns:
+        tuple: (output_path, error_message)
+    """
+    file_name = os.path.basename(input_path)
+    data, error = app.extract_data_from_input(input_path)
+    if error or not data:
+        write_error_report(output_dir, file_name, error or "Không đọc được dữ liệu", data)
+        return None, error or "Không đọc được dữ liệu"
+    
+    data['file_name'] = file_name
+    ho_ten_clean = app.sanitize_filename(data.get('Họ tên', os.path.splitext(file_name)[0]))
+    output_path = get_available_output_path(output_dir, f"{ho_ten_clean}_GiayXacNhan")
+    
+    # Ghi ra file tạm rồi đổi tên để hệ thống khác không đọc file ghi dở
+    partial_path = output_path + '.part'
+    if not app.fill_template(app.select_template(data.get('doc_type')), data, partial_path):
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        write_error_report(output_dir, file_name, "Lỗi khi xử lý template", data)
+        return None, "Lỗi khi xử lý template"
+    
+    os.replace(partial_path, output_path)
+    return output_path, None
+
+def process_batch(app, batch, input_dir, output_dir, processed):
+    """
+    Xử lý một lô file và chuyển file input ra khỏi thư mục theo dõi
+    
+    Args:
+        app (module): Module app_batch_refactored
+        batch (list): Danh sách đường dẫn file input
+        input_dir (str): Thư mục input
+        output_dir (str): Thư mục output
+        processed (dict): Nơi ghi nhớ file không chuyển đi được: path -> (size, mtime)
+    """
+    start = time.perf_counter()
+    success_count = 0
+    
+    for input_path in batch:
+        try:
+            stat = os.stat(input_path)
+            signature = (stat.st_size, stat.st_mtime)
+        except OSError:
+            signature = None
+        
+        try:
+            output_path, error = process_file(app, input_path, output_dir)
+        except Exception as e:
+            output_path, error = None, f"Lỗi xử lý: {str(e)}"
+            write_error_report(output_dir, os.path.basename(input_path), error, None)
+        
+        if output_path:
+            success_count += 1
+            target_dir = os.path.join(input_dir, 'processed')
+            print(f"✅ {os.path.basename(input_path)} -> {os.path.basename(output_path)}", flush=True)
+        else:
+            target_dir = os.path.join(input_dir, 'failed')
+            print(f"❌ {os.path.basename(input_path)}: {error}", flush=True)
+        
+        try:
+            move_input(input_path, target_dir)
+        except Exception as e:
+            # File vẫn nằm trong thư mục theo dõi: ghi nhớ để không xử lý lại
+            print(f"⚠️ Không chuyển được {os.path.basename(input_path)} sang {target_dir}: {str(e)}", flush=True)
+            if signature is not None:
+                processed[input_path] = signature
+    
+    print(f"Lô {len(batch)} file: {success_count} thành công ({time.perf_counter() - start:.2f}s)", flush=True)
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def run_daemon(input_dir, output_dir, batch_size, batch_window, settle_seconds, poll_interval):
+    """
+    Vòng lặp chính: quét thư mục, gom lô và xử lý
+    
+    Một lô được xử lý khi đủ batch_size file, hoặc khi file sẵn sàng cũ nhất
+    đã chờ quá batch_window giây.
+    """
+    # Tắt cảnh báo bare mode của Streamlit khi import app
+    logging.disable(logging.WARNING)
+    sys.path.insert(0, APP_DIR)
+    import app_batch_refactored as app
+    
+    os.makedirs(input_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Đang theo dõi {input_dir} -> {output_dir}", flush=True)
+    
+    pending = {}
+    processed = {}
+    while True:
+        ready = scan_ready_files(input_dir, pending, settle_seconds, processed)
+        
+        if ready:
+            oldest = min(first_seen for _, first_seen in ready)
+            if len(ready) >= batch_size or time.time() - oldest >= batch_window:
+                batch = [path for path, _ in ready[:batch_size]]
+                process_batch(app, batch, input_dir, output_dir, processed)
+                for path in batch:
+                    pending.pop(path, None)
+                continue
+        
+        time.sleep(poll_interval)
+
+def main():
+    """Hàm chính của watch daemon"""
+    parser = argparse.ArgumentParser(description="Tự động xử lý file .docx thả vào thư mục theo dõi")
+    parser.add_argument('--input-dir', required=True, help="Thư mục theo dõi")
+    parser.add_argument('--output-dir', required=True, help="Thư mục ghi kết quả")
+    parser.add_argument('--batch-size', type=int, default=20, help="Số file tối đa mỗi lô")
+    parser.add_argument('--batch-window', type=float, default=5.0, help="Thời gian chờ tối đa để gom lô (giây)")
+    parser.add_argument('--settle', type=float, default=2.0, help="Thời gian file phải ổn định trước khi đọc (giây)")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="Chu kỳ quét thư mục (giây)")
+    args = parser.parse_args()
+    
+    input_dir = os.path.abspath(args.input_dir)
+    output_dir = os.path.abspath(args.output_dir)
+    
+    # App dùng đường dẫn template tương đối (temp/mau.docx)
+    os.chdir(APP_DIR)
+    
+    try:
+        run_daemon(input_dir, output_dir, args.batch_size, args.batch_window, args.settle, args.poll_interval)
+    except KeyboardInterrupt:
+        print("Đã dừng", flush=True)
+
+if __name__ == "__main__":
+    main()
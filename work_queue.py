@@ -0,0 +1,316 @@
+"""
+=============================================================================
+WORK QUEUE - HÀNG ĐỢI PHÂN TÁN QUA THƯ MỤC SPOOL
+=============================================================================
+Chia việc xử lý giấy xác nhận cho nhiều worker trên một hoặc nhiều máy.
+Thư mục spool (đặt trên ổ dùng chung nếu chạy nhiều máy) gồm:
+    queue.db   - hàng đợi SQLite (trạng thái job, lease)
+    inbox/     - file input đã đưa vào hàng đợi
+    results/   - file .docx đã điền
+
+Worker nhận job bằng lease có thời hạn. Worker bị dừng đột ngột sẽ không
+gia hạn lease, job được trả lại hàng đợi khi lease hết hạn.
+
+Đường dẫn file trong queue.db là đường dẫn tương đối so với thư mục spool,
+nên mỗi máy có thể mount ổ dùng chung ở vị trí khác nhau.
+
+Lưu ý: khi chạy nhiều máy, ổ dùng chung phải hỗ trợ khóa file cho SQLite.
+
+Cách dùng:
+    python work_queue.py --spool /mnt/spool enqueue thu_muc_input/ file1.docx
+    python work_queue.py --spool /mnt/spool worker
+    python work_queue.py --spool /mnt/spool status
+=============================================================================
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+LEASE_SECONDS = 300  # Thời hạn lease mỗi job
+MAX_ATTEMPTS = 3  # Số lần thử tối đa trước khi đánh dấu lỗi
+POLL_INTERVAL = 2.0  # Giây chờ giữa các lần kiểm tra hàng đợi rỗng
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_name TEXT NOT NULL,
+    content_hash TEXT NOT NULL UNIQUE,
+    input_path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    output_path TEXT,
+    error TEXT,
+    data_json TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, lease_expires);
+"""
+
+# =============================================================================
+# QUEUE FUNCTIONS
+# =============================================================================
+
+def open_queue(spool_dir):
+    """
+    Mở (hoặc tạo) hàng đợi trong thư mục spool
+    
+    Args:
+        spool_dir (str): Thư mục spool
+    
+    Returns:
+        sqlite3.Connection: Kết nối tới queue.db
+    """
+    os.makedirs(os.path.join(spool_dir, 'inbox'), exist_ok=True)
+    os.makedirs(os.path.join(spool_dir, 'results'), exist_ok=True)
+    
+    conn = sqlite3.connect(os.path.join(spool_dir, 'queue.db'), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+def enqueue_file(conn, spool_dir, file_path):
+    """
+    Đưa một file input vào hàng đợi (bỏ qua nếu đã có file cùng nội dung)
+    
+    Args:
+        conn (sqlite3.Connection): Kết nối hàng đợi
+        spool_dir (str): Thư mục spool
+        file_path (str): Đường dẫn file input
+    
+    Returns:
+        bool: True nếu đã thêm job mới
+    """
+    with open(file_path, 'rb') as f:
+        content_hash = hashlib.sha256(f.read()).hexdigest()
+    
+    input_name = os.path.join('inbox', f"{content_hash}.docx")
+    input_path = os.path.join(spool_dir, input_name)
+    if not os.path.exists(input_path):
+        # Copy ra file tạm riêng của tiến trình này rồi đổi tên để worker không
+        # đọc file ghi dở và không đụng file tạm của máy khác cùng đưa file vào
+        partial_path = f"{input_path}.{socket.gethostname()}_{os.getpid()}.part"
+        shutil.copyfile(file_path, partial_path)
+        os.replace(partial_path, input_path)
+    
+    now = time.time()
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO jobs (file_name, content_hash, input_path, created, updated) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (os.path.basename(file_path), content_hash, input_name, now, now)
+    )
+    return cursor.rowcount > 0
+
+def claim_job(conn, worker_id):
+    """
+    Nhận một job đang chờ hoặc có lease đã hết hạn
+    
+    Args:
+        conn (sqlite3.Connection): Kết nối hàng đợi
+        worker_id (str): Mã worker
+    
+    Returns:
+        sqlite3.Row: Job đã nhận, hoặc None nếu hàng đợi rỗng
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Job hết lease quá số lần thử cho phép thì đánh dấu lỗi
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Vượt quá số lần thử', lease_owner = NULL, updated = ? "
+            "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, now, MAX_ATTEMPTS)
+        )
+        
+        job = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'pending' "
+            "OR (status = 'leased' AND lease_expires < ?) ORDER BY id LIMIT 1",
+            (now,)
+        ).fetchone()
+        
+        if job is not None:
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker_id, now + LEASE_SECONDS, now, job['id'])
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    
+    return job
+
+def renew_lease(conn, job_id, worker_id):
+    """
+    Gia hạn lease của job đang xử lý
+    
+    Returns:
+        bool: False nếu job đã bị worker khác nhận lại
+    """
+    cursor = conn.execute(
+        "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+        (time.time() + LEASE_SECONDS, time.time(), job_id, worker_id)
+    )
+    return cursor.rowcount > 0
+
+def finish_job(conn, job_id, worker_id, status, output_path=None, error=None, data=None):
+    """
+    Ghi kết quả job (chỉ khi worker vẫn đang giữ lease)
+    
+    Args:
+        conn (sqlite3.Connection): Kết nối hàng đợi
+        job_id (int): Mã job
+        worker_id (str): Mã worker
+        status (str): 'done' hoặc 'failed'
+        output_path (str): Đường dẫn file output, tương đối so với thư mục spool
+        error (str): Thông báo lỗi
+        data (dict): Dữ liệu đã trích xuất
+    
+    Returns:
+        bool: False nếu lease đã bị worker khác nhận lại
+    """
+    cursor = conn.execute(
+        "UPDATE jobs SET status = ?, output_path = ?, error = ?, data_json = ?, "
+        "lease_owner = NULL, lease_expires = NULL, updated = ? "
+        "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+        (status, output_path, error, json.dumps(data, ensure_ascii=False) if data else None,
+         time.time(), job_id, worker_id)
+    )
+    return cursor.rowcount > 0
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+def process_job(app, conn, spool_dir, job, worker_id):
+    """
+    Trích xuất và điền template cho một job
+    
+    Args:
+        app (module): Module app_batch_refactored
+        conn (sqlite3.Connection): Kết nối hàng đợi
+        spool_dir (str): Thư mục spool
+        job (sqlite3.Row): Job đã nhận
+        worker_id (str): Mã worker
+    """
+    data, error = app.extract_data_from_input(os.path.join(spool_dir, job['input_path']))
+    if error or not data:
+        finish_job(conn, job['id'], worker_id, 'failed', error=error or "Không đọc được dữ liệu", data=data)
+        return
+    
+    if not renew_lease(conn, job['id'], worker_id):
+        return
+    
+    data['file_name'] = job['file_name']
+    ho_ten_clean = app.sanitize_filename(data.get('Họ tên', ''))
+    output_name = os.path.join('results', app.sanitize_filename(f"{ho_ten_clean}_GiayXacNhan_{job['id']}.docx"))
+    output_path = os.path.join(spool_dir, output_name)
+    
+    template_path = app.select_template(data.get('doc_type'))
+    partial_path = output_path + '.part'
+    if app.fill_template(template_path, data, partial_path):
+        os.replace(partial_path, output_path)
+        finish_job(conn, job['id'], worker_id, 'done', output_path=output_name, data=data)
+    else:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        finish_job(conn, job['id'], worker_id, 'failed', error="Lỗi khi xử lý template", data=data)
+
+def run_worker(spool_dir, once=False):
+    """
+    Vòng lặp worker: nhận job, xử lý, ghi kết quả
+    
+    Args:
+        spool_dir (str): Thư mục spool
+        once (bool): Thoát khi hàng đợi rỗng thay vì chờ job mới
+    """
+    # Tắt cảnh báo bare mode của Streamlit khi import app
+    logging.disable(logging.WARNING)
+    sys.path.insert(0, APP_DIR)
+    import app_batch_refactored as app
+    
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    conn = open_queue(spool_dir)
+    print(f"Worker {worker_id} bắt đầu, spool: {spool_dir}")
+    
+    while True:
+        job = claim_job(conn, worker_id)
+        if job is None:
+            if once:
+                break
+            time.sleep(POLL_INTERVAL)
+            continue
+        
+        start = time.perf_counter()
+        try:
+            process_job(app, conn, spool_dir, job, worker_id)
+        except Exception as e:
+            finish_job(conn, job['id'], worker_id, 'failed', error=f"Lỗi xử lý: {str(e)}")
+        
+        status = conn.execute("SELECT status FROM jobs WHERE id = ?", (job['id'],)).fetchone()['status']
+        print(f"[{status}] #{job['id']} {job['file_name']} ({time.perf_counter() - start:.2f}s)")
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def print_status(conn):
+    """In số lượng job theo trạng thái và danh sách job lỗi"""
+    for row in conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status ORDER BY status"):
+        print(f"{row['status']:<10}{row['n']:>8}")
+    
+    for row in conn.execute("SELECT id, file_name, error FROM jobs WHERE status = 'failed' ORDER BY id"):
+        print(f"❌ #{row['id']} {row['file_name']}: {row['error']}")
+
+def main():
+    """Hàm chính của work queue"""
+    parser = argparse.ArgumentParser(description="Hàng đợi phân tán xử lý giấy xác nhận")
+    parser.add_argument('--spool', required=True, help="Thư mục spool dùng chung")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    enqueue_parser = subparsers.add_parser('enqueue', help="Đưa file .docx vào hàng đợi")
+    enqueue_parser.add_argument('paths', nargs='+', help="File .docx hoặc thư mục chứa file .docx")
+    
+    worker_parser = subparsers.add_parser('worker', help="Chạy worker xử lý job")
+    worker_parser.add_argument('--once', action='store_true', help="Thoát khi hàng đợi rỗng")
+    
+    subparsers.add_parser('status', help="Xem trạng thái hàng đợi")
+    args = parser.parse_args()
+    
+    spool_dir = os.path.abspath(args.spool)
+    
+    if args.command == 'enqueue':
+        conn = open_queue(spool_dir)
+        added = skipped = 0
+        for path in args.paths:
+            files = sorted(glob.glob(os.path.join(path, '*.docx'))) if os.path.isdir(path) else [path]
+            for file_path in files:
+                if enqueue_file(conn, spool_dir, file_path):
+                    added += 1
+                else:
+                    skipped += 1
+        print(f"Đã thêm {added} job, bỏ qua {skipped} file trùng")
+    
+    elif args.command == 'worker':
+        # App dùng đường dẫn template tương đối (temp/mau.docx)
+        os.chdir(APP_DIR)
+        run_worker(spool_dir, once=args.once)
+    
+    elif args.command == 'status':
+        print_status(open_queue(spool_dir))
+
+if __name__ == "__main__":
+    main()